@@ -0,0 +1,276 @@
+'''
+Sonar audio. Pings and echoes are synthesized with NumPy when the
+game starts and cached by their parameters, so the frame loop only
+ever plays buffers. The player's pings play on a channel of their
+own, echoes are scheduled for when they would get back to the player
+and played through a fixed pool of reserved mixer channels, with
+their volume and pan set from where the echoing object is.
+
+Works with any SDL audio driver, including 'dummy' and 'disk' for
+headless runs. Without an initialised mixer the AudioSystem does
+nothing.
+'''
+import heapq
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+import pygame
+
+from sound import core
+from sound.instrument import instruments
+
+
+# pitch in Hz of the ping per pulse per second of the player
+PITCH_PER_FREQUENCY = 550.0
+PING_DURATION = 0.35
+ECHO_DURATION = 0.25
+# objects of this radius echo at the pitch of the ping, smaller
+# ones higher and larger ones lower, in steps of a semitone
+ECHO_REFERENCE_RADIUS = 0.1
+ECHO_SEMITONES = 12
+
+# mixer sample size -> NumPy dtype and peak amplitude
+SAMPLE_TYPES = {
+    -8: (numpy.int8, 127, 0),
+    8: (numpy.uint8, 127, 128),
+    -16: (numpy.int16, 32767, 0),
+    16: (numpy.uint16, 32767, 32768),
+    32: (numpy.float32, 1.0, 0),
+}
+
+
+def synthesize(pitch, duration, sample_rate, decay,
+               harmonics=(1.0, 0.5, 0.25), noise=0.0):
+    '''
+    Returns a mono float array in the range (-1, 1) of a decaying
+    tone with the given harmonics, optionally mixed with noise.
+    '''
+    t = numpy.arange(int(duration * sample_rate)) / float(sample_rate)
+    wave = numpy.zeros(len(t))
+    for harmonic, amplitude in enumerate(harmonics, 1):
+        wave += amplitude * numpy.sin(2.0 * math.pi * pitch * harmonic * t)
+    if noise:
+        wave += noise * numpy.random.RandomState(0).uniform(-1, 1, len(t))
+    # short attack so the tone doesn't click
+    envelope = numpy.exp(-decay * t) * numpy.minimum(1.0, t / 0.005)
+    wave *= envelope
+    peak = numpy.abs(wave).max()
+    if peak > 0:
+        wave *= 0.8 / peak
+    return wave
+
+
+def to_mixer_format(wave, size, channels):
+    '''
+    Converts a mono float wave into an array pygame.sndarray
+    can make a sound from for the given mixer format.
+    '''
+    dtype, amplitude, offset = SAMPLE_TYPES[size]
+    samples = (wave * amplitude + offset).astype(dtype)
+    if channels == 1:
+        return samples
+    return numpy.ascontiguousarray(numpy.repeat(samples[:, None], channels, 1))
+
+
+def ping_pitch(frequency):
+    return PITCH_PER_FREQUENCY * frequency
+
+
+def echo_semitone(radius):
+    '''
+    Returns the semitones an object's echo is shifted by
+    relative to the ping.
+    '''
+    semitone = int(round(-6.0 * math.log(radius / ECHO_REFERENCE_RADIUS, 2)))
+    return max(-ECHO_SEMITONES, min(semitone, ECHO_SEMITONES))
+
+
+class SoundCache(object):
+    '''
+    Synthesized sounds keyed by their parameters. Sounds that
+    aren't cached yet are synthesized on a background thread,
+    get returns None until they are ready.
+    '''
+
+    def __init__(self, mixer_format):
+        '''
+        mixer_format: (sample rate, size, channels) from pygame.mixer.get_init
+        '''
+        self.sample_rate, self.size, self.channels = mixer_format
+        self.sounds = {}
+        self._pending = {}
+        self._executor = None
+
+    def key(self, kind, frequency, semitone=0):
+        return (kind, round(frequency, 3), semitone)
+
+    def synthesize(self, key):
+        kind, frequency, semitone = key
+        pitch = ping_pitch(frequency) * 2.0**(semitone / 12.0)
+        if kind == 'ping':
+            wave = synthesize(pitch, PING_DURATION, self.sample_rate, 12.0)
+        else:
+            # echoes are duller and fade faster
+            wave = synthesize(pitch, ECHO_DURATION, self.sample_rate, 20.0,
+                              harmonics=(1.0, 0.2), noise=0.05)
+        return pygame.sndarray.make_sound(
+            to_mixer_format(wave, self.size, self.channels))
+
+    def prepare(self, key):
+        '''
+        Synthesizes a sound now, for use outside the frame loop.
+        '''
+        if key not in self.sounds:
+            self.sounds[key] = self.synthesize(key)
+        return self.sounds[key]
+
+    def get(self, key):
+        sound = self.sounds.get(key)
+        if sound is not None:
+            return sound
+        future = self._pending.get(key)
+        if future is None:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1)
+            self._pending[key] = self._executor.submit(self.synthesize, key)
+        elif future.done():
+            del self._pending[key]
+            sound = self.sounds[key] = future.result()
+        return sound
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class AudioSystem(core.UpdateableObject):
+    '''
+    Listens to the pulse system for new pulses and for pulses
+    reaching hidden objects, and plays pings and echoes on the
+    simulation clock.
+    '''
+    PING_VOLUME = 0.5
+    ECHO_VOLUME = 0.8
+    # how quickly echoes get quieter with the distance sound travelled
+    ATTENUATION = 3.0
+
+    def __init__(self, player, pulse_system, channels=8):
+        '''
+        player: core.Player the pings come from and the echoes go back to
+        pulse_system: core.PulseSystem that is listened to
+        channels: int, number of mixer channels reserved for echoes
+        '''
+        self.player = player
+        self.time = 0.0
+        self.played = 0
+        self.dropped = 0
+        self._pings = 0
+        self._echoes = []
+        # (due time, order, key, left volume, right volume)
+        self._scheduled = []
+        self._order = 0
+        self.cache = None
+        mixer_format = pygame.mixer.get_init()
+        if mixer_format is None:
+            return
+
+        self.cache = SoundCache(mixer_format)
+        if pygame.mixer.get_num_channels() < channels + 1:
+            pygame.mixer.set_num_channels(channels + 1)
+        pygame.mixer.set_reserved(channels + 1)
+        self.ping_channel = pygame.mixer.Channel(0)
+        self.echo_channels = [pygame.mixer.Channel(i)
+                              for i in range(1, channels + 1)]
+        self._next_channel = 0
+        self.prepare(player.frequency)
+        pulse_system.listener = self
+
+    def prepare(self, frequency):
+        '''
+        Synthesizes the ping and every echo of a player frequency.
+        '''
+        cache = self.cache
+        cache.prepare(cache.key('ping', frequency))
+        for semitone in range(-ECHO_SEMITONES, ECHO_SEMITONES + 1):
+            cache.prepare(cache.key('echo', frequency, semitone))
+
+    def ping(self, pulses, slot):
+        self._pings += 1
+
+    def echo(self, obj, pulses, slots):
+        '''
+        Called when the pulses in slots reach obj.
+        '''
+        for slot in slots:
+            self._echoes.append((obj, float(pulses.x[slot]),
+                                 float(pulses.y[slot]),
+                                 float(pulses.speed[slot])))
+
+    def update(self, delta_time, events):
+        self.time += delta_time
+        if self.cache is None:
+            return
+        player = self.player
+        cache = self.cache
+        if self._pings:
+            self._pings = 0
+            sound = cache.get(cache.key('ping', player.frequency))
+            if sound is not None:
+                self.ping_channel.play(sound)
+                self.ping_channel.set_volume(self.PING_VOLUME)
+
+        for obj, x, y, speed in self._echoes:
+            self.schedule_echo(obj, x, y, speed)
+        del self._echoes[:]
+
+        scheduled = self._scheduled
+        while scheduled and scheduled[0][0] <= self.time:
+            _, _, key, left, right = heapq.heappop(scheduled)
+            self.play_echo(key, left, right)
+
+    def schedule_echo(self, obj, x, y, speed):
+        player = self.player
+        # the pulse travelled from where it was emitted to the edge
+        # of the object, and the echo travels back to the player
+        outward = max(math.hypot(obj.x - x, obj.y - y) - obj.radius, 0.0)
+        dx = obj.x - player.x
+        distance = math.hypot(dx, obj.y - player.y)
+        back = max(distance - obj.radius, 0.0)
+        delay = back / speed * 1000.0 if speed > 0 else 0.0
+
+        volume = self.ECHO_VOLUME / (1.0 + self.ATTENUATION * (outward + back))
+        pan = dx / distance if distance > 0 else 0.0
+        # equal power panning
+        angle = (pan + 1.0) * math.pi * 0.25
+        key = self.cache.key('echo', player.frequency, echo_semitone(obj.radius))
+        self._order += 1
+        heapq.heappush(self._scheduled, (self.time + delay, self._order, key,
+                                         volume * math.cos(angle),
+                                         volume * math.sin(angle)))
+
+    def play_echo(self, key, left, right):
+        sound = self.cache.get(key)
+        if sound is None:
+            self.dropped += 1
+            instruments.count('echoes dropped')
+            return
+        channels = self.echo_channels
+        channel = None
+        for candidate in channels:
+            if not candidate.get_busy():
+                channel = candidate
+                break
+        if channel is None:
+            # all busy, cut off roughly the echo that was started first
+            channel = channels[self._next_channel]
+        self._next_channel = (channels.index(channel) + 1) % len(channels)
+        channel.play(sound)
+        channel.set_volume(left, right)
+        self.played += 1
+        instruments.count('echoes played')
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.shutdown()
@@ -0,0 +1,310 @@
+'''
+Batch environment for running many headless game sessions, e.g.
+to evaluate agents or tune levels. BatchEnv steps N independent
+worlds in lockstep: every step takes one action per world and
+returns one observation per world, plus the rendered frames if
+asked for.
+
+The worlds are split into contiguous shards, each simulated by a
+worker process. Actions, observations and frames live in shared
+memory NumPy buffers that the workers write into directly, so a
+step only sends a short command to every worker.
+
+    with BatchEnv(64, frame_size=(84, 84)) as env:
+        observations, frames = env.reset()
+        for _ in range(1000):
+            observations, frames = env.step(policy(observations))
+'''
+import os
+import math
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy
+import pygame
+
+
+# action bits, combined to move diagonally
+UP = 1
+DOWN = 2
+RIGHT = 4
+LEFT = 8
+# key codes the action bits stand for
+ACTION_KEYS = ((UP, pygame.K_UP), (DOWN, pygame.K_DOWN),
+               (RIGHT, pygame.K_RIGHT), (LEFT, pygame.K_LEFT))
+
+# echo_x and echo_y are the mean direction from the player to the
+# objects that echoed during the step
+OBSERVATION_FIELDS = ('player_x', 'player_y', 'pulses',
+                      'echoes', 'echo_x', 'echo_y')
+
+
+def init_headless():
+    '''
+    Initialises only the parts of pygame a batch of offscreen
+    canvases needs, so no window or audio device is opened.
+    '''
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.font.init()
+
+
+def action_keys(action):
+    return set(key for bit, key in ACTION_KEYS if action & bit)
+
+
+class _EchoListener(object):
+    '''
+    Collects the echoes of a world during a step, in place of
+    the audio system.
+    '''
+
+    def __init__(self, player):
+        self.player = player
+        self.clear()
+
+    def clear(self):
+        self.echoes = 0
+        self.x = 0.0
+        self.y = 0.0
+
+    def ping(self, pulses, slot):
+        pass
+
+    def echo(self, obj, pulses, slots):
+        dx = obj.x - self.player.x
+        dy = obj.y - self.player.y
+        distance = math.hypot(dx, dy)
+        if distance > 0:
+            self.x += dx / distance * len(slots)
+            self.y += dy / distance * len(slots)
+        self.echoes += len(slots)
+
+
+class _Shard(object):
+    '''
+    The worlds start to stop of a batch, simulated in this process.
+    '''
+
+    def __init__(self, start, stop, config, buffers):
+        from sound.render import Canvas
+
+        self.start = start
+        self.stop = stop
+        self.config = config
+        self.actions = buffers['actions'][start:stop]
+        self.observations = buffers['observations'][start:stop]
+        self.frames = None
+        if 'frames' in buffers:
+            self.frames = buffers['frames'][start:stop]
+        width, height = config['frame_size'] or (1, 1)
+        self.canvases = [Canvas(width, height, background=(0, 0, 0),
+                                offscreen=True)
+                         for _ in range(start, stop)]
+        self.games = []
+        self.listeners = []
+
+    def reset(self, seeds):
+        from sound.game import Game
+
+        self.games = []
+        self.listeners = []
+        for canvas, seed in zip(self.canvases, seeds[self.start:self.stop]):
+            game = Game(canvas, hidden_objects=self.config['hidden_objects'],
+                        seed=int(seed), quality=self.config['quality'],
+                        audio=False)
+            listener = _EchoListener(game.player)
+            game.pulse_system.listener = listener
+            self.games.append(game)
+            self.listeners.append(listener)
+        self.observe()
+
+    def step(self):
+        step_time = self.config['step_time']
+        for game, listener, action in zip(self.games, self.listeners,
+                                          self.actions.tolist()):
+            listener.clear()
+            game.keys_down = action_keys(action)
+            game_events = {'keys_down': game.keys_down,
+                           'mouse_down': game.mouse_down}
+            for _ in range(self.config['steps_per_action']):
+                game.update(step_time, game_events)
+                game.collide()
+                game.remove_dead()
+        self.observe()
+
+    def observe(self):
+        observations = self.observations
+        for i, (game, listener) in enumerate(zip(self.games, self.listeners)):
+            echoes = listener.echoes
+            observations[i] = (game.player.x, game.player.y,
+                               len(game.pulse_system), echoes,
+                               listener.x / echoes if echoes else 0.0,
+                               listener.y / echoes if echoes else 0.0)
+            if self.frames is not None:
+                game.render()
+                # surfarray is indexed (x, y), frames are (y, x)
+                self.frames[i] = pygame.surfarray.pixels3d(
+                    game.canvas.display).swapaxes(0, 1)
+
+
+def _work(connection, start, stop, config, layout):
+    '''
+    Worker process: attaches to the shared buffers and runs
+    the commands sent by the BatchEnv on its shard.
+    '''
+    init_headless()
+    memories = [shared_memory.SharedMemory(name=name)
+                for name, _, _, _ in layout]
+    buffers = dict((key, numpy.ndarray(shape, dtype, buffer=memory.buf))
+                   for memory, (_, key, shape, dtype) in zip(memories, layout))
+    shard = _Shard(start, stop, config, buffers)
+    try:
+        while True:
+            command, argument = connection.recv()
+            if command == 'close':
+                break
+            try:
+                getattr(shard, command)(*argument)
+            except Exception:
+                connection.send(traceback.format_exc())
+            else:
+                connection.send(None)
+    finally:
+        del shard, buffers
+        for memory in memories:
+            memory.close()
+        connection.close()
+
+
+class BatchEnv(object):
+    '''
+    N independent worlds stepped in lockstep, see the module docstring.
+    '''
+
+    def __init__(self, worlds, workers=None, hidden_objects=20, seed=0,
+                 frame_size=None, step_time=1000.0 / 120, steps_per_action=1,
+                 quality=0):
+        '''
+        worlds: int, number of worlds in the batch
+        workers: int, number of worker processes, defaults to the
+                 number of CPUs, 0 simulates in this process
+        hidden_objects: int, number of hidden objects in every world
+        seed: int, world i is generated from seed + i on reset
+        frame_size: (width, height) of the frames rendered after every
+                    step, None to not render
+        step_time: float, ms simulated by every simulation step
+        steps_per_action: int, simulation steps every action is held for
+        quality: int, index of the quality level, see sound.quality
+        '''
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.worlds = worlds
+        self.seed = seed
+        self.config = {
+            'hidden_objects': hidden_objects,
+            'frame_size': frame_size,
+            'step_time': step_time,
+            'steps_per_action': steps_per_action,
+            'quality': quality,
+        }
+
+        layout = [('actions', (worlds,), numpy.uint8),
+                  ('observations', (worlds, len(OBSERVATION_FIELDS)),
+                   numpy.float32)]
+        if frame_size is not None:
+            width, height = frame_size
+            layout.append(('frames', (worlds, height, width, 3), numpy.uint8))
+        self._memories = []
+        buffers = {}
+        for key, shape, dtype in layout:
+            size = max(int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize, 1)
+            memory = shared_memory.SharedMemory(create=True, size=size)
+            self._memories.append((memory, key, shape, dtype))
+            buffers[key] = numpy.ndarray(shape, dtype, buffer=memory.buf)
+        buffers['actions'][:] = 0
+        self.actions = buffers['actions']
+        self.observations = buffers['observations']
+        self.frames = buffers.get('frames')
+
+        self._shard = None
+        self._workers = []
+        bounds = numpy.linspace(0, worlds, min(workers, worlds) + 1).astype(int)
+        if not workers:
+            init_headless()
+            self._shard = _Shard(0, worlds, self.config, buffers)
+            return
+        # spawned workers start with a clean pygame
+        context = multiprocessing.get_context('spawn')
+        worker_layout = [(memory.name, key, shape, dtype)
+                         for memory, key, shape, dtype in self._memories]
+        for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_work, args=(worker_connection, start, stop,
+                                    self.config, worker_layout))
+            process.daemon = True
+            process.start()
+            self._workers.append((process, connection))
+
+    def _run(self, command, *argument):
+        if self._shard is not None:
+            getattr(self._shard, command)(*argument)
+            return
+        for _, connection in self._workers:
+            connection.send((command, argument))
+        errors = [connection.recv() for _, connection in self._workers]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise RuntimeError('batch worker failed:\n%s' % errors[0])
+
+    def reset(self, seeds=None):
+        '''
+        Generates new worlds, from seed + i unless an array of
+        seeds is given. Returns (observations, frames), which are
+        overwritten by the next step.
+        '''
+        if seeds is None:
+            seeds = numpy.arange(self.worlds) + self.seed
+        self.actions[:] = 0
+        self._run('reset', numpy.asarray(seeds).tolist())
+        return self.observations, self.frames
+
+    def step(self, actions):
+        '''
+        actions: array of one action (bits of UP, DOWN, RIGHT and
+                 LEFT) per world
+
+        Returns (observations, frames), which are overwritten
+        by the next step.
+        '''
+        self.actions[:] = actions
+        self._run('step')
+        return self.observations, self.frames
+
+    def close(self):
+        for process, connection in self._workers:
+            connection.send(('close', ()))
+        for process, connection in self._workers:
+            process.join()
+            connection.close()
+        self._workers = []
+        self._shard = None
+        self.actions = self.observations = self.frames = None
+        for memory, _, _, _ in self._memories:
+            try:
+                memory.close()
+            except BufferError:
+                # arrays returned by step are still around, the
+                # memory is freed once they are gone
+                pass
+            memory.unlink()
+        self._memories = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
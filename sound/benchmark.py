@@ -0,0 +1,313 @@
+'''
+Headless, deterministic simulation runs that measure how long
+each phase of a frame takes.
+
+    python -m sound.benchmark run --hidden-objects 200 --pulses 8 -o new.json
+    python -m sound.benchmark compare base.json new.json --tolerance 0.1
+
+Runs use the SDL dummy video driver, a fixed timestep, a seeded
+world and scripted input, so two runs with the same options
+simulate exactly the same frames.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy
+import pygame
+
+
+PHASES = ('events', 'update', 'collision', 'render')
+ARROW_KEYS = (pygame.K_UP, pygame.K_DOWN, pygame.K_RIGHT, pygame.K_LEFT)
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def init_headless():
+    '''
+    Initialises pygame without opening a window. Has to be
+    called before the display is first used.
+    '''
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.init()
+
+
+def scripted_input(frames, seed=0, hold=30):
+    '''
+    Returns a list with the pygame events of every frame. The
+    player holds a random set of arrow keys for hold frames
+    at a time.
+    '''
+    rand = random.Random(seed)
+    script = []
+    held = set()
+    for frame in range(frames):
+        events = []
+        if frame % hold == 0:
+            new_held = set(key for key in ARROW_KEYS if rand.random() < 0.3)
+            for key in sorted(held - new_held):
+                events.append(pygame.event.Event(pygame.KEYUP, key=key, mod=0))
+            for key in sorted(new_held - held):
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=key, mod=0))
+            held = new_held
+        script.append(events)
+    return script
+
+
+def seed_pulses(game, count):
+    '''
+    Fills the world with count pulses of staggered radii and
+    sets the player's pulse frequency so the number of live
+    pulses stays at count. Fewer pulses are seeded if the pulse
+    cap of the quality level is lower, returns the number seeded.
+    '''
+    if count <= 0:
+        return 0
+    player = game.player
+    pulses = game.pulse_system
+    max_pulses = pulses.quality.max_pulses
+    if max_pulses is not None:
+        count = min(count, max_pulses - len(pulses))
+    max_radius = 0.5
+    for i in range(count):
+        slot = pulses.emit(player.x, player.y, player.pulse_speed, max_radius)
+        pulses.radius[slot] = max_radius * i / float(count)
+    player.frequency = count * player.pulse_speed / max_radius
+    player.milliseconds_per_pulse = 1.0 / player.frequency * 1000.0
+    return count
+
+
+def summarize(samples):
+    samples = numpy.float64(samples)
+    if not len(samples):
+        return {}
+    return {
+        'mean': float(samples.mean()),
+        'p50': float(numpy.percentile(samples, 50)),
+        'p95': float(numpy.percentile(samples, 95)),
+        'p99': float(numpy.percentile(samples, 99)),
+        'max': float(samples.max()),
+    }
+
+
+def run(hidden_objects=20, pulses=4, frames=600, warmup=30, seed=0,
+        width=900, height=900, timestep=1000.0 / 60, dirty_rects=False,
+        incremental_echo=False, draw_workers=0, world_path=None,
+        quality=0):
+    '''
+    Simulates warmup + frames frames and returns the frame time
+    distribution (in ms) of every phase, ignoring warmup frames.
+    With a world_path the streamed world's objects are the only
+    hidden objects.
+    '''
+    from sound.render import Canvas
+    from sound.game import Game
+
+    if world_path is not None:
+        hidden_objects = 0
+    init_headless()
+    canvas = Canvas(width, height, background=(0, 0, 0),
+                    dirty_rects=dirty_rects, draw_workers=draw_workers)
+    game = Game(canvas, hidden_objects=hidden_objects, seed=seed,
+                incremental_echo=incremental_echo, world_path=world_path,
+                quality=quality)
+    seed_pulses(game, pulses)
+    script = scripted_input(warmup + frames, seed)
+
+    samples = dict((phase, []) for phase in PHASES)
+    totals = []
+    frame_time = 0.0
+    for frame, events in enumerate(script):
+        t0 = timer()
+        game_events = game.handle_events(events)
+        t1 = timer()
+        game.update(timestep, game_events)
+        t2 = timer()
+        game.collide()
+        t3 = timer()
+        game.render((('Frame time', '%.2f ms' % frame_time),))
+        t4 = timer()
+        game.remove_dead()
+
+        frame_time = (t4 - t0) * 1000.0
+        if frame < warmup:
+            continue
+        for phase, start, end in zip(PHASES, (t0, t1, t2, t3),
+                                     (t1, t2, t3, t4)):
+            samples[phase].append((end - start) * 1000.0)
+        totals.append(frame_time)
+
+    return {
+        'config': {
+            'hidden_objects': hidden_objects,
+            'pulses': pulses,
+            'frames': frames,
+            'warmup': warmup,
+            'seed': seed,
+            'width': width,
+            'height': height,
+            'timestep': timestep,
+            'dirty_rects': dirty_rects,
+            'incremental_echo': incremental_echo,
+            'draw_workers': draw_workers,
+            'world': world_path,
+            'quality': quality,
+        },
+        'phases': dict((phase, summarize(samples[phase]))
+                       for phase in PHASES),
+        'frame': summarize(totals),
+    }
+
+
+def compare_timings(baseline, current, tolerance=0.1, statistic='p50',
+                    min_delta=0.05, names=None):
+    '''
+    Compares two dicts of name -> time summary (see summarize) and
+    returns a list of (name, baseline, current, ratio) for every name
+    that got slower by more than tolerance (a fraction). Slowdowns
+    under min_delta ms are treated as timer noise. names are compared
+    in order, by default every name of baseline, and names missing
+    from either dict are skipped.
+    '''
+    regressions = []
+    if names is None:
+        names = sorted(baseline)
+    for name in names:
+        if name not in baseline or name not in current:
+            continue
+        base = baseline[name].get(statistic)
+        cur = current[name].get(statistic)
+        if not base or cur is None:
+            continue
+        ratio = cur / base
+        if ratio > 1.0 + tolerance and cur - base >= min_delta:
+            regressions.append((name, base, cur, ratio))
+    return regressions
+
+
+def compare(baseline, current, tolerance=0.1, statistic='p50',
+            min_delta=0.05):
+    '''
+    Compares two run results, see compare_timings.
+    '''
+    def timings(result):
+        values = dict(result['phases'])
+        values['frame'] = result['frame']
+        return values
+
+    return compare_timings(timings(baseline), timings(current), tolerance,
+                           statistic, min_delta, PHASES + ('frame',))
+
+
+def add_compare_arguments(parser):
+    '''
+    Adds the options of compare_timings to an argparse parser.
+    '''
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown as a fraction')
+    parser.add_argument('--statistic', default='p50',
+                        choices=('mean', 'p50', 'p95', 'p99', 'max'))
+    parser.add_argument('--min-delta', type=float, default=0.05,
+                        help='ignore slowdowns under this many ms')
+
+
+def report_regressions(regressions, out=sys.stdout):
+    '''
+    Writes the regressions found by compare_timings and returns
+    the exit status, 1 if there are any.
+    '''
+    for name, base, cur, ratio in regressions:
+        out.write('%s: %.3f ms -> %.3f ms (%+.1f%%)\n'
+                  % (name, base, cur, (ratio - 1.0) * 100))
+    if regressions:
+        return 1
+    out.write('no regressions\n')
+    return 0
+
+
+def print_result(result, out=sys.stdout):
+    config = result['config']
+    if config.get('world'):
+        objects = 'world %s' % config['world']
+    else:
+        objects = '%s hidden objects' % config['hidden_objects']
+    out.write('%s, %s pulses, %s frames, seed %s, %sx%s\n'
+              % (objects, config['pulses'], config['frames'], config['seed'],
+                 config['width'], config['height']))
+    out.write('%-10s %8s %8s %8s %8s %8s\n'
+              % ('phase (ms)', 'mean', 'p50', 'p95', 'p99', 'max'))
+    rows = [(phase, result['phases'][phase]) for phase in PHASES]
+    rows.append(('frame', result['frame']))
+    for name, stats in rows:
+        out.write('%-10s %8.3f %8.3f %8.3f %8.3f %8.3f\n'
+                  % (name, stats['mean'], stats['p50'], stats['p95'],
+                     stats['p99'], stats['max']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless frame-time benchmark')
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='simulate and time frames')
+    run_parser.add_argument('--hidden-objects', type=int, default=20)
+    run_parser.add_argument('--pulses', type=int, default=4)
+    run_parser.add_argument('--frames', type=int, default=600)
+    run_parser.add_argument('--warmup', type=int, default=30)
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--size', type=int, nargs=2, default=(900, 900),
+                            metavar=('WIDTH', 'HEIGHT'))
+    run_parser.add_argument('--dirty-rects', action='store_true',
+                            help='present only the changed regions')
+    run_parser.add_argument('--incremental-echo', action='store_true',
+                            help='keep a decaying echo per hidden object')
+    run_parser.add_argument('--draw-workers', type=int, default=0,
+                            help='threads preparing echoes in parallel')
+    run_parser.add_argument('--world', help='stream a chunked world '
+                            '(see python -m sound.chunks) instead of '
+                            'generating hidden objects')
+    run_parser.add_argument('--quality', type=int, default=0,
+                            help='index of the quality level, see '
+                            'sound.quality.LEVELS')
+    run_parser.add_argument('-o', '--output', help='write the result as JSON')
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare two results, exits with 1 on regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    add_compare_arguments(compare_parser)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        result = run(hidden_objects=args.hidden_objects, pulses=args.pulses,
+                     frames=args.frames, warmup=args.warmup, seed=args.seed,
+                     width=args.size[0], height=args.size[1],
+                     dirty_rects=args.dirty_rects,
+                     incremental_echo=args.incremental_echo,
+                     draw_workers=args.draw_workers,
+                     world_path=args.world, quality=args.quality)
+        print_result(result)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+        return 0
+    elif args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        if baseline['config'] != current['config']:
+            sys.stderr.write('warning: the runs used different options\n')
+        return report_regressions(compare(baseline, current, args.tolerance,
+                                          args.statistic, args.min_delta))
+
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+import numpy
+import pygame
+
+
+class Camera(object):
+    '''
+    Affine world to display transform shared by every object
+    rendered on a Canvas. The world x range (-1, 1) spans the
+    display width, y points up and is scaled like x.
+    '''
+
+    def __init__(self, width, height):
+        # bumped every time the transform changes so objects
+        # can cheaply detect that they need to be redrawn
+        self.version = 0
+        self.width = None
+        self.height = None
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        if width == self.width and height == self.height:
+            return
+        self.width = width
+        self.height = height
+        self.aspect_ratio = width / float(height)
+        self.scale = width * 0.5
+        self.offset_x = width * 0.5
+        self.offset_y = height * 0.5
+        self.version += 1
+
+    def to_display(self, x, y):
+        '''
+        Scalar fast path, transforms a single world point.
+        '''
+        return (x * self.scale + self.offset_x,
+                -y * self.scale + self.offset_y)
+
+    def to_display_array(self, points):
+        '''
+        Transforms an array of world points with shape (..., 2)
+        in one pass and returns a new float64 array.
+        '''
+        points = numpy.array(points, dtype=numpy.float64)
+        points *= (self.scale, -self.scale)
+        points += (self.offset_x, self.offset_y)
+        return points
+
+    def to_display_length(self, length):
+        return length * self.scale
+
+    def display_rect(self, x, y, width, height):
+        '''
+        Returns the display Rect of a world rectangle centred on (x, y).
+        '''
+        display_width = width * self.scale
+        display_height = height * self.scale
+        centre_x, centre_y = self.to_display(x, y)
+        return pygame.Rect(centre_x - display_width * 0.5,
+                           centre_y - display_height * 0.5,
+                           display_width, display_height)
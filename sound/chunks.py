@@ -0,0 +1,212 @@
+'''
+Large worlds stored in chunks. A chunked world is a directory with
+
+    meta.json    chunk size and object count
+    chunks.npy   (cx, cy, start, count) of every non-empty chunk
+    objects.npy  x, y, radius and colour of every object, grouped
+                 by chunk
+
+objects.npy is memory-mapped, so only the chunks that are streamed
+in around the player are ever read from disk.
+'''
+import os
+import json
+import math
+
+import numpy
+
+from sound import core
+
+
+OBJECT_DTYPE = numpy.dtype([('x', '<f4'), ('y', '<f4'), ('radius', '<f4'),
+                            ('colour', 'u1', (3,))])
+CHUNK_DTYPE = numpy.dtype([('cx', '<i4'), ('cy', '<i4'),
+                           ('start', '<i8'), ('count', '<i8')])
+
+
+def save_world(path, x, y, radius, colour, chunk_size=1.0):
+    '''
+    Writes objects (arrays of positions, radii and (n, 3) colours)
+    as a chunked world directory.
+    '''
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    cx = numpy.floor(x / chunk_size).astype(numpy.int32)
+    cy = numpy.floor(y / chunk_size).astype(numpy.int32)
+    order = numpy.lexsort((cy, cx))
+
+    objects = numpy.empty(len(x), dtype=OBJECT_DTYPE)
+    objects['x'] = x[order]
+    objects['y'] = y[order]
+    objects['radius'] = numpy.asarray(radius)[order]
+    objects['colour'] = numpy.asarray(colour)[order]
+
+    keys = numpy.column_stack((cx[order], cy[order]))
+    if len(keys):
+        starts = numpy.flatnonzero(numpy.any(numpy.diff(keys, axis=0) != 0, axis=1)) + 1
+        starts = numpy.concatenate(([0], starts))
+    else:
+        starts = numpy.zeros(0, dtype=int)
+    chunks = numpy.empty(len(starts), dtype=CHUNK_DTYPE)
+    chunks['cx'] = keys[starts, 0] if len(keys) else []
+    chunks['cy'] = keys[starts, 1] if len(keys) else []
+    chunks['start'] = starts
+    chunks['count'] = numpy.diff(numpy.concatenate((starts, [len(x)])))
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    numpy.save(os.path.join(path, 'objects.npy'), objects)
+    numpy.save(os.path.join(path, 'chunks.npy'), chunks)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'chunk_size': chunk_size, 'objects': len(x)}, f)
+
+
+def generate_world(path, count, extent=10.0, chunk_size=1.0, seed=None):
+    '''
+    Writes a world of count random hidden objects spread over
+    (-extent, extent) in both directions.
+    '''
+    rand = numpy.random.RandomState(seed)
+    x = rand.uniform(-extent, extent, count)
+    y = rand.uniform(-extent, extent, count)
+    radius = rand.uniform(0.05, 0.15, count)
+    colour = rand.randint(0, 256, (count, 3))
+    save_world(path, x, y, radius, colour, chunk_size)
+
+
+class ChunkedWorld(object):
+    '''
+    Read access to a chunked world directory.
+    '''
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.chunk_size = meta['chunk_size']
+        self.objects = numpy.load(os.path.join(path, 'objects.npy'),
+                                  mmap_mode='r')
+        chunks = numpy.load(os.path.join(path, 'chunks.npy'))
+        self.index = dict(((int(c['cx']), int(c['cy'])),
+                           (int(c['start']), int(c['count'])))
+                          for c in chunks)
+
+    def __len__(self):
+        return len(self.objects)
+
+    def chunk_key(self, x, y):
+        return (int(math.floor(x / self.chunk_size)),
+                int(math.floor(y / self.chunk_size)))
+
+    def chunks_in_rect(self, left, bottom, right, top):
+        '''
+        Returns the keys of the non-empty chunks overlapping a rect.
+        '''
+        x0, y0 = self.chunk_key(left, bottom)
+        x1, y1 = self.chunk_key(right, top)
+        return set(key for key in ((i, j) for i in range(x0, x1 + 1)
+                                   for j in range(y0, y1 + 1))
+                   if key in self.index)
+
+    def chunk(self, key):
+        '''
+        Returns the objects of a chunk as a structured array
+        (read from disk now).
+        '''
+        start, count = self.index.get(key, (0, 0))
+        return numpy.array(self.objects[start:start + count])
+
+
+class ChunkStreamer(core.UpdateableObject):
+    '''
+    Keeps the hidden objects of the chunks near the player and in
+    the viewport in the game and removes those of chunks that are
+    left behind, so memory and per-frame cost don't depend on the
+    size of the world.
+    '''
+
+    def __init__(self, game, world, reach=None, margin=None):
+        '''
+        game: sound.game.Game the objects are added to
+        world: ChunkedWorld
+        reach: float, radius around the player to load, defaults to
+               the maximum pulse radius
+        margin: float, extra distance before loaded chunks are unloaded,
+                defaults to half a chunk
+        '''
+        self.game = game
+        self.world = world
+        self.reach = reach if reach is not None else 0.5
+        self.margin = margin if margin is not None else world.chunk_size * 0.5
+        # chunk key -> list of hidden objects
+        self.loaded = {}
+        self.loads = 0
+        self.unloads = 0
+        self._player_chunk = None
+        self._camera_version = None
+
+    def required_chunks(self, margin=0.0):
+        player = self.game.player
+        reach = self.reach + margin
+        keys = self.world.chunks_in_rect(player.x - reach, player.y - reach,
+                                         player.x + reach, player.y + reach)
+        # the part of the world shown by the camera
+        camera = self.game.canvas.camera
+        half_height = 1.0 / camera.aspect_ratio
+        keys.update(self.world.chunks_in_rect(-1 - margin, -half_height - margin,
+                                              1 + margin, half_height + margin))
+        return keys
+
+    def update(self, delta_time, events):
+        player = self.game.player
+        player_chunk = self.world.chunk_key(player.x, player.y)
+        camera_version = self.game.canvas.camera.version
+        # the needed chunks only change when the player enters
+        # another chunk or the viewport changes
+        if (player_chunk == self._player_chunk and
+                camera_version == self._camera_version):
+            return
+        self._player_chunk = player_chunk
+        self._camera_version = camera_version
+        self.stream()
+
+    def stream(self):
+        for key in self.required_chunks() - set(self.loaded):
+            self.load(key)
+        keep = self.required_chunks(self.margin)
+        for key in [key for key in self.loaded if key not in keep]:
+            self.unload(key)
+
+    def load(self, key):
+        objects = []
+        for data in self.world.chunk(key):
+            obj = core.HiddenObject(float(data['x']), float(data['y']),
+                                    float(data['radius']),
+                                    tuple(int(c) for c in data['colour']))
+            obj.incremental_echo = self.game.incremental_echo
+            obj.debug = self.game.debug
+            self.game.add(obj)
+            objects.append(obj)
+        self.loaded[key] = objects
+        self.loads += 1
+
+    def unload(self, key):
+        for obj in self.loaded.pop(key):
+            self.game.remove(obj)
+        self.unloads += 1
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Generate a random chunked world')
+    parser.add_argument('path')
+    parser.add_argument('--objects', type=int, default=10000)
+    parser.add_argument('--extent', type=float, default=10.0)
+    parser.add_argument('--chunk-size', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    generate_world(args.path, args.objects, args.extent, args.chunk_size,
+                   args.seed)
+
+
+if __name__ == '__main__':
+    main()
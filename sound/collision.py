@@ -0,0 +1,115 @@
+import math
+
+
+class SpatialHash(object):
+    '''
+    Uniform grid over world coordinates used as the collision
+    broad phase. Every object is stored in each cell its bounding
+    box covers, and only objects sharing a cell are reported as
+    candidate pairs.
+    '''
+
+    def __init__(self, cell_size=0.25):
+        '''
+        cell_size: float, width and height of a cell in world units
+        '''
+        self.cell_size = cell_size
+        self.cells = {}
+        self._object_bounds = {}
+
+    def __len__(self):
+        return len(self._object_bounds)
+
+    def __contains__(self, obj):
+        return obj in self._object_bounds
+
+    def cell_bounds(self, x, y, radius):
+        '''
+        Returns the inclusive (x0, y0, x1, y1) range of cell
+        indices covered by the bounding box of a circle.
+        '''
+        inverse = 1.0 / self.cell_size
+        return (int(math.floor((x - radius) * inverse)),
+                int(math.floor((y - radius) * inverse)),
+                int(math.floor((x + radius) * inverse)),
+                int(math.floor((y + radius) * inverse)))
+
+    def insert(self, obj):
+        self.update(obj)
+
+    def update(self, obj):
+        '''
+        Moves obj into the cells covered by its current position
+        and bounding radius. Cheap when the covered cells haven't
+        changed, which is the case for most frames.
+        '''
+        bounds = self.cell_bounds(obj.x, obj.y, obj.bounding_radius)
+        old_bounds = self._object_bounds.get(obj)
+        if bounds == old_bounds:
+            return
+        if old_bounds is not None:
+            self._unlink(obj, old_bounds)
+        self._link(obj, bounds)
+        self._object_bounds[obj] = bounds
+
+    def remove(self, obj):
+        bounds = self._object_bounds.pop(obj, None)
+        if bounds is not None:
+            self._unlink(obj, bounds)
+
+    def clear(self):
+        self.cells.clear()
+        self._object_bounds.clear()
+
+    def query(self, x, y, radius):
+        '''
+        Returns the set of objects stored in any cell covered
+        by the bounding box of the given circle.
+        '''
+        return self._objects_in(self.cell_bounds(x, y, radius))
+
+    def candidate_pairs(self, objects):
+        '''
+        Yields every unordered pair of one of objects and an object
+        sharing at least one cell with it, each pair exactly once.
+        Pairs of two objects that aren't in objects are left out, so
+        only the moving objects have to be passed.
+        '''
+        done = set()
+        for obj in objects:
+            bounds = self._object_bounds.get(obj)
+            if bounds is None:
+                continue
+            done.add(obj)
+            for other in self._objects_in(bounds):
+                # sharing a cell is symmetric, so pairs with an
+                # object already done were yielded for that object
+                if other not in done:
+                    yield obj, other
+
+    def _objects_in(self, bounds):
+        found = set()
+        x0, y0, x1, y1 = bounds
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                cell = self.cells.get((i, j))
+                if cell:
+                    found.update(cell)
+        return found
+
+    def _link(self, obj, bounds):
+        x0, y0, x1, y1 = bounds
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                self.cells.setdefault((i, j), set()).add(obj)
+
+    def _unlink(self, obj, bounds):
+        x0, y0, x1, y1 = bounds
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                cell = self.cells.get((i, j))
+                if cell is None:
+                    continue
+                cell.discard(obj)
+                if not cell:
+                    del self.cells[(i, j)]
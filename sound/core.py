@@ -1,38 +1,75 @@
+import copy
 import math
 
 import numpy
-from numpy.matrixlib import matrix
 import pygame
 
-from sound.utils import intersect_circles
-from sound import event
+from sound import echo
+from sound import world
+from sound.pool import default_pool
+from sound.quality import LEVELS
+from sound.instrument import instruments
 
 
 class UpdateableObject(object):
     '''
     Objects that are updated every game loop
     '''
+    COMPONENTS = (world.UPDATEABLE,)
     dead = False
 
     def update(self, delta_time, events):
         pass
 
+    def interpolate(self, alpha):
+        '''
+        Moves the object to where it would be alpha (0 to 1) of the
+        way between its previous and current simulation state, for
+        rendering between two fixed simulation steps.
+        '''
+        pass
+
+    def end_interpolation(self):
+        '''
+        Restores the current simulation state after interpolate.
+        '''
+        pass
+
 
 class CollidableObject(object):
     '''
     Objects that are checked for collisions
     '''
+    COMPONENTS = (world.COLLIDABLE,)
+    # radius of the circle bounding the object in world units,
+    # used by the collision broad phase
+    bounding_radius = 0.0
 
     def collide(self, obj):
         pass
 
+    def collide_pulses(self, pulses, slots):
+        '''
+        pulses: PulseSystem
+        slots: array of the pulse slots that may touch this object
+        '''
+        pass
+
 
 class VisibleObject(object):
     '''
     Objects that are rendered every game loop
     '''
+    COMPONENTS = (world.VISIBLE,)
 
     DISPLAY_FLAGS = pygame.SRCALPHA
+    SURFACE_POOL = default_pool
+    # prepare_draw can run on a worker thread
+    PARALLEL_DRAW = False
+    # simulation state the renderer reads, see sound.pipeline
+    SNAPSHOT_FIELDS = ('x', 'y', 'width', 'height', 'visible', 'debug')
+    # fields referring to other objects, replaced by their mirrors
+    SNAPSHOT_REFERENCES = ()
 
     def __init__(self, x, y, width, height):
         '''
@@ -47,105 +84,166 @@ class VisibleObject(object):
         self.height = height
         self.dirty = True
         self.visible = True
+        # where the object was blitted on the display last
+        self._drawn_rect = None
 
     def draw(self):
         pass
 
-    def construct_world_to_display_matrix(self, display_surface):
-        if hasattr(self, '_display_width'):
-            new_display_width = display_surface.get_width()
-            new_display_height = display_surface.get_height()
-            # if the dimensions haven't changed, the matrix
-            # doesn't have to be recomputed
-            if (new_display_width == self._display_width and
-                new_display_height == self._display_height):
-                return
-            self._display_width = new_display_width
-            self._display_height = new_display_height
-            self._aspect_ratio = self._display_width / float(self._display_height)
-        else:
-            self._display_width = display_surface.get_width()
-            self._display_height = display_surface.get_height()
-            self._aspect_ratio = self._display_width / float(self._display_height)
-
-        
-        flip = matrix(((1, 0, 0), (0, -1, 0), (0, 0, 1)))
-        translate = matrix(((1, 0, self._display_width * 0.5),
-                            (0, 1, self._display_height * 0.5),
-                            (0, 0, 1)))
-        scale = matrix(((self._display_width * 0.5, 0, 0),
-                        (0, self._display_width * 0.5, 1),
-                        (0, 0, 1)))
-        # order is flip, scale, translate
-        mat = translate * (scale* flip)
-
-        self.world_to_display_matrix = mat
-        self.scale_matrix = scale
-        self.dirty = True
+    def snapshot(self):
+        '''
+        Returns the values of SNAPSHOT_FIELDS and a version that
+        changes whenever the object was marked dirty since the last
+        snapshot. Called on the simulation thread.
+        '''
+        version = getattr(self, '_snapshot_version', 0)
+        if self.dirty:
+            self.dirty = False
+            version = self._snapshot_version = version + 1
+        return tuple(getattr(self, name, None)
+                     for name in self.SNAPSHOT_FIELDS), version
+
+    def mirror(self):
+        '''
+        Returns a copy of the object for the render thread. The
+        mirror owns the surface and all other render state, and is
+        kept up to date with apply_snapshot.
+        '''
+        mirror = copy.copy(self)
+        mirror.surface = None
+        mirror.dirty = True
+        mirror._drawn_rect = None
+        mirror._snapshot_version = None
+        mirror.__dict__.pop('_display_rect', None)
+        mirror.__dict__.pop('_camera_version', None)
+        return mirror
+
+    def apply_snapshot(self, values, version):
+        for name, value in zip(self.SNAPSHOT_FIELDS, values):
+            setattr(self, name, value)
+        if version != self._snapshot_version:
+            self._snapshot_version = version
+            self.dirty = True
+
+    def prepare_draw(self):
+        '''
+        Does the pure computation part of draw ahead of time.
+        Must not touch pygame surfaces, so that the Canvas can run
+        it for many objects in parallel before rendering them.
+        '''
+        pass
+
+    @property
+    def is_shown(self):
+        return self.visible or getattr(self, 'debug', False)
 
     @property
     def display_rect(self):
         if not hasattr(self, '_display_rect'):
-            vector_dims = matrix([[self.width], [self.height], [1]])
-            vector_pos = matrix([[self.x], [self.y], [1]])
-            vector_dims = self.scale_matrix * vector_dims
-            vector_pos = self.world_to_display_matrix * vector_pos
-            top_left = vector_pos - vector_dims * 0.5
-            self._display_rect = pygame.Rect(top_left.item(0), top_left.item(1),
-                                             vector_dims.item(0), vector_dims.item(1))
+            self._display_rect = self.camera.display_rect(
+                self.x, self.y, self.width, self.height)
         return self._display_rect
 
-    def pre_render(self, surface):
-        self.construct_world_to_display_matrix(surface)
+    def pre_render(self, camera):
+        # the camera changed (e.g. the display was resized)
+        # so everything has to be redrawn at the new scale
+        if camera.version != getattr(self, '_camera_version', None):
+            self._camera_version = camera.version
+            self.dirty = True
+        self.camera = camera
         if self.dirty and hasattr(self, '_display_rect'):
             delattr(self, '_display_rect')
 
+    def dirty_rects(self):
+        '''
+        Returns the display regions this object changes in the
+        current frame, i.e. where it was drawn last and where
+        it will be drawn now. Must be called after pre_render.
+        '''
+        drawn = self._drawn_rect
+        if not self.is_shown:
+            return [drawn] if drawn else []
+        rect = self.display_rect
+        if not self.dirty and rect == drawn:
+            return []
+        return [drawn, rect] if drawn else [rect]
+
     def render(self, surface):
-        if not self.visible and not getattr(self, 'debug', False):
+        if not self.is_shown:
+            self._drawn_rect = None
             return
 
         # check if this object is off-screen
         if not self.display_rect.colliderect(surface.get_rect()):
+            self._drawn_rect = None
             return
 
         if self.dirty:
-            self.surface = pygame.Surface((self.display_rect.width,
-                                           self.display_rect.height),
-                                          VisibleObject.DISPLAY_FLAGS)
+            if getattr(self, 'surface', None) is not None:
+                self.SURFACE_POOL.release(self.surface)
+            self.surface = self.SURFACE_POOL.acquire(self.display_rect.width,
+                                                     self.display_rect.height,
+                                                     VisibleObject.DISPLAY_FLAGS)
             self.draw()
             self.dirty = False
 
         surface.blit(self.surface, self.display_rect)
+        self._drawn_rect = self.display_rect.copy()
+
+
+def _slot_property(name):
+    def fget(self):
+        return getattr(self.system, name)[self.slot]
 
+    def fset(self, value):
+        getattr(self.system, name)[self.slot] = value
 
-class Pulse(UpdateableObject, CollidableObject, VisibleObject):
+    return property(fget, fset)
+
+
+class Pulse(VisibleObject):
     '''
     A pulse that increases it's radius
-    over time.
+    over time. Pulses are views onto a
+    slot of a PulseSystem, which owns their
+    state and updates them.
     '''
-
-    def __init__(self, x, y, speed):
-        VisibleObject.__init__(self, x, y, 4, 4)
-        self.speed = speed
-        self.radius = 0.0
-        self.max_radius = 0.5
+    x = _slot_property('x')
+    y = _slot_property('y')
+    radius = _slot_property('radius')
+    speed = _slot_property('speed')
+    max_radius = _slot_property('max_radius')
+
+    def __init__(self, system, slot):
+        self.system = system
+        self.slot = slot
+        # the display rect follows the ring, see display_rect
+        VisibleObject.__init__(self, system.x[slot], system.y[slot], 0, 0)
         self.visible = False
 
-    def update(self, delta_time, events):
-        self.radius += self.speed * delta_time / 1000.0
-        if self.radius >= self.max_radius:
-            self.dead = True
-        self.dirty = True
+    @property
+    def dead(self):
+        return not self.system.alive[self.slot]
 
-    def render(self, surface):
-        if not self.is_outside_display:
-            super(Pulse, self).render(surface)
+    @property
+    def display_rect(self):
+        # bounds of the ring, pulses are drawn straight onto
+        # the display instead of into an offscreen surface
+        if not hasattr(self, '_display_rect'):
+            self._display_rect = self.camera.display_rect(
+                self.x, self.y, self.radius * 2, self.radius * 2)
+        return self._display_rect
+
+    @property
+    def is_shown(self):
+        return (super(Pulse, self).is_shown
+                and not self.is_outside_display)
 
     @property
     def is_outside_display(self):
         # check if all of the four
         # corners are inside the circle
-        visible_height = 1.0 / self._aspect_ratio
+        visible_height = 1.0 / self.camera.aspect_ratio
         for x, y in ((-1, visible_height), (-1, -visible_height),
                      (1, -visible_height), (1, visible_height)):
             r2 = (x - self.x)**2 + (y - self.y)**2
@@ -154,119 +252,388 @@ class Pulse(UpdateableObject, CollidableObject, VisibleObject):
 
         return True
 
-    def draw(self):
-        rect = self.surface.get_rect()
-        display_radius = self.radius * self.scale_matrix.item(0)
-        width = 1 if display_radius > 1 else 0
-        pygame.draw.ellipse(self.surface, (255, 255, 255),
-                            pygame.Rect(rect.centerx - display_radius,
-                                        rect.centery - display_radius,
-                                        display_radius * 2,
-                                        display_radius * 2),
-                            width)
+    def render(self, surface):
+        if not self.is_shown:
+            self._drawn_rect = None
+            return
 
-    def collide(self, obj):
-        pass
+        rect = self.display_rect
+        if not rect.colliderect(surface.get_rect()):
+            self._drawn_rect = None
+            return
+
+        width = 1 if rect.width > 2 else 0
+        pygame.draw.ellipse(surface, (255, 255, 255), rect, width)
+        self.dirty = False
+        self._drawn_rect = rect.copy()
+
+
+class PulseSystem(UpdateableObject):
+    '''
+    Keeps the state of every pulse in preallocated
+    arrays (one slot per pulse) so that all pulses are
+    updated and expired in one vectorised step. Slots
+    of expired pulses are reused by new pulses.
+    '''
+    # renders its pulses
+    COMPONENTS = (world.VISIBLE,)
+    # sets the pulse cap and how far pulses travel
+    quality = LEVELS[0]
+
+    def __init__(self, capacity=16):
+        self.capacity = 0
+        self.x = numpy.zeros(0)
+        self.y = numpy.zeros(0)
+        self.radius = numpy.zeros(0)
+        # radius before the last update
+        self.previous_radius = numpy.zeros(0)
+        self.speed = numpy.zeros(0)
+        self.max_radius = numpy.zeros(0)
+        self.alive = numpy.zeros(0, dtype=bool)
+        # pulses that expired on the last update, they
+        # still collide once so echoes get cleared
+        self.expired = numpy.zeros(0, dtype=bool)
+        self.pulses = []
+        self._free = []
+        self.debug = False
+        # told about new pulses and pulses reaching hidden
+        # objects, see sound.audio.AudioSystem
+        self.listener = None
+        self._grow(capacity)
+
+    def __len__(self):
+        return int(numpy.count_nonzero(self.alive))
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        for name in ('x', 'y', 'radius', 'previous_radius', 'speed',
+                     'max_radius', 'alive', 'expired'):
+            array = getattr(self, name)
+            setattr(self, name, numpy.concatenate(
+                (array, numpy.zeros(extra, dtype=array.dtype))))
+        self.pulses.extend(Pulse(self, slot)
+                           for slot in range(self.capacity, capacity))
+        # lowest slots are handed out first
+        self._free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def emit(self, x, y, speed, max_radius=None):
+        '''
+        Starts a new pulse at (x, y) and returns its slot, or None
+        if the pulse cap of the quality level is reached.
+        '''
+        quality = self.quality
+        if quality.max_pulses is not None and len(self) >= quality.max_pulses:
+            return None
+        if max_radius is None:
+            max_radius = quality.pulse_radius
+        if not self._free:
+            self._grow(self.capacity * 2)
+        slot = self._free.pop()
+        self.x[slot] = x
+        self.y[slot] = y
+        self.radius[slot] = 0.0
+        self.previous_radius[slot] = 0.0
+        self.speed[slot] = speed
+        self.max_radius[slot] = max_radius
+        self.alive[slot] = True
+        self.expired[slot] = False
+        if self.listener is not None:
+            self.listener.ping(self, slot)
+        return slot
+
+    @property
+    def live_slots(self):
+        return numpy.flatnonzero(self.alive)
+
+    @property
+    def active_slots(self):
+        '''
+        Slots of live pulses and of pulses that expired on
+        the last update.
+        '''
+        return numpy.flatnonzero(self.alive | self.expired)
+
+    def update(self, delta_time, events):
+        # slots that expired on the previous update are free now
+        released = numpy.flatnonzero(self.expired)
+        if len(released):
+            self._free.extend(released.tolist())
+            self.expired[released] = False
+
+        alive = self.alive
+        self.previous_radius[alive] = self.radius[alive]
+        self.radius[alive] += self.speed[alive] * (delta_time / 1000.0)
+        expired = alive & (self.radius >= self.max_radius)
+        self.alive &= ~expired
+        self.expired |= expired
+
+    def interpolate(self, alpha):
+        self._radius = self.radius.copy()
+        alive = self.alive
+        previous = self.previous_radius[alive]
+        self.radius[alive] = previous + (self.radius[alive] - previous) * alpha
+
+    def end_interpolation(self):
+        self.radius = self._radius
+
+    def collide(self, spatial_hash):
+        '''
+        Finds the collidable objects in the cells covered by each
+        pulse and hands them the candidate pulse slots as an array.
+        '''
+        candidates = {}
+        for slot in self.active_slots.tolist():
+            for obj in spatial_hash.query(self.x[slot], self.y[slot],
+                                          self.radius[slot]):
+                candidates.setdefault(obj, []).append(slot)
+
+        for obj, slots in candidates.items():
+            obj.collide_pulses(self, numpy.array(slots))
+
+    # arrays the renderer reads, see sound.pipeline
+    SNAPSHOT_FIELDS = ('x', 'y', 'radius', 'previous_radius', 'alive',
+                       'expired')
+    SNAPSHOT_REFERENCES = ()
+
+    def snapshot(self):
+        # pulses are redrawn every frame, so there is no version
+        return tuple(getattr(self, name).copy()
+                     for name in self.SNAPSHOT_FIELDS) + (self.debug,), 0
+
+    def mirror(self):
+        mirror = copy.copy(self)
+        mirror.listener = None
+        mirror.pulses = [Pulse(mirror, slot) for slot in range(self.capacity)]
+        return mirror
+
+    def apply_snapshot(self, values, version):
+        for name, value in zip(self.SNAPSHOT_FIELDS, values):
+            setattr(self, name, value)
+        self.debug = values[-1]
+        self.capacity = len(self.alive)
+        self.pulses.extend(Pulse(self, slot)
+                           for slot in range(len(self.pulses), self.capacity))
+
+    def pre_render(self, camera):
+        for slot in self.live_slots.tolist():
+            pulse = self.pulses[slot]
+            pulse.debug = self.debug
+            # pulses grow every frame
+            pulse.dirty = True
+            pulse.pre_render(camera)
+
+    def dirty_rects(self):
+        rects = []
+        for pulse in self.pulses:
+            if pulse.dead:
+                # clear expired pulses
+                if pulse._drawn_rect:
+                    rects.append(pulse._drawn_rect)
+                    pulse._drawn_rect = None
+            else:
+                rects.extend(pulse.dirty_rects())
+        return rects
+
+    def render(self, surface):
+        for slot in self.live_slots.tolist():
+            self.pulses[slot].render(surface)
 
 
 class HiddenObject(CollidableObject, VisibleObject):
+    # incremental echo mode keeps a persistent, decaying echo
+    # instead of redrawing every band of every pulse
+    INCREMENTAL_ECHO = False
+    PARALLEL_DRAW = True
+    # band count, echo resolution and size cut-off of the echo
+    quality = LEVELS[0]
+    SNAPSHOT_FIELDS = VisibleObject.SNAPSHOT_FIELDS + (
+        'colour', 'radius', 'quality', 'incremental_echo', 'pulse_slots',
+        'pulse_system')
+    SNAPSHOT_REFERENCES = ('pulse_system',)
 
     def __init__(self, x, y, radius, colour):
         super(HiddenObject, self).__init__(x, y, radius * 2, radius * 2)
         self.colour = colour
         self.radius = radius
-        self.pulses = set()
+        self.pulse_system = None
+        self.pulse_slots = set()
+        self.incremental_echo = HiddenObject.INCREMENTAL_ECHO
+        self.echo_layer = None
+        self._echo_pixels = None
+        self._rim_key = None
+        self._rim = None
+        self._bands_key = None
+        self._bands = None
+
+    @property
+    def bounding_radius(self):
+        return self.radius
+
+    def pre_render(self, camera):
+        # the echo keeps fading after the pulses have passed
+        if self.echo_layer is not None and self.echo_layer.glowing:
+            self.dirty = True
+        super(HiddenObject, self).pre_render(camera)
 
     def draw(self):
         if getattr(self, 'debug', False):
             pygame.draw.ellipse(self.surface, (32, 32, 32), self.surface.get_rect())
-        display_to_object_surface_matrix = matrix([
-            [1, 0, -self.display_rect.left],
-            [0, 1, -self.display_rect.top],
-            [0, 0, 1],
-        ])
-        unit = self.display_rect.width / self.width
-        bands = 80
-
-        for pulse in self.pulses:
-            for i in range(-bands, 0, 4):
-                result, points = intersect_circles(
-                    pulse.x, pulse.y,
-                    self.x, self.y,
-                    pulse.radius + i * 0.5 / unit,
-                    self.radius
-                )
-                if not result or points is None:
-                    continue
-
-                try:
-                    colour_factor = 1.0 / (math.fabs(i + bands / 2.0))**0.33333
-                    colour = [int(round(c * colour_factor)) for c in self.colour]
-                except ZeroDivisionError:
-                    colour = self.colour
-
-                for p in points:
-                    point_on_display = self.world_to_display_matrix * p
-                    point_on_surface = (display_to_object_surface_matrix
-                                        * point_on_display)
-                    pygame.draw.circle(self.surface, colour,
-                                       (int(round(point_on_surface.item(0))),
-                                        int(round(point_on_surface.item(1)))),
-                                       1)
-
-        self.pulses.clear()
-
-    def collide(self, obj):
-        # hidden objects collide with pulses in a special way
-        if isinstance(obj, Pulse):
-            # check for the non-colliding cases
-            distance_sq = (obj.x - self.x)**2 + (obj.y - self.y)**2
-            if distance_sq > (obj.radius + self.radius)**2:
-                return
-            if not obj.dead:
-                self.pulses.add(obj)
-            self.dirty = True
+        pixels = self._echo_pixels
+        self._echo_pixels = None
+        if pixels is None:
+            pixels = self.compute_echo()
+        if pixels is not None:
+            echo.write_pixels(self.surface, *pixels)
+            instruments.count('points drawn', len(pixels[0]))
+
+    def prepare_draw(self):
+        self._echo_pixels = self.compute_echo()
+
+    def snapshot(self):
+        values = super(HiddenObject, self).snapshot()
+        # the pulses hit so far go to the renderer with the snapshot
+        self.pulse_slots = set()
+        return values
+
+    def mirror(self):
+        mirror = super(HiddenObject, self).mirror()
+        mirror.echo_layer = None
+        mirror._echo_pixels = None
+        mirror._rim_key = None
+        mirror._rim = None
+        mirror._bands_key = None
+        mirror._bands = None
+        return mirror
+
+    def compute_echo(self):
+        '''
+        Returns (xs, ys, rgb, alpha) of the echo pixels on the
+        object's surface, or None if there is no echo. Only uses
+        NumPy, so it can run on a worker thread.
+        '''
+        if not self.pulse_slots and self.echo_layer is None:
+            return None
+
+        quality = self.quality
+        rect = self.display_rect
+        if max(rect.width, rect.height) < quality.min_echo_size:
+            # too small for the echo to be worth drawing
+            self.pulse_slots.clear()
+            self.echo_layer = None
+            return None
+
+        camera = self.camera
+        centre_x, centre_y = camera.to_display(self.x, self.y)
+        # the rim only changes when the object is moved or scaled
+        rim_key = (rect.width, rect.height, centre_x - rect.left,
+                   centre_y - rect.top, camera.to_display_length(self.radius),
+                   quality.echo_resolution)
+        if rim_key != self._rim_key:
+            self._rim_key = rim_key
+            self._rim = echo.rim_pixels(*rim_key)
+            if self.echo_layer is not None:
+                self.echo_layer.reset(self._rim)
+        rim = self._rim
+
+        slots = sorted(self.pulse_slots)
+        self.pulse_slots.clear()
+        pulses = numpy.empty((len(slots), 3))
+        if slots:
+            pulse_system = self.pulse_system
+            pulses[:, :2] = camera.to_display_array(numpy.column_stack(
+                (pulse_system.x[slots], pulse_system.y[slots])))
+            pulses[:, :2] -= (rect.left, rect.top)
+            pulses[:, 2] = camera.to_display_length(pulse_system.radius[slots])
+
+        if self.incremental_echo:
+            if self.echo_layer is None:
+                self.echo_layer = echo.EchoLayer()
+                self.echo_layer.reset(rim)
+            self.echo_layer.advance(slots, pulses)
+            return self.echo_layer.pixels(self.colour)
+
+        bands = self.band_table()
+        xs, ys, rgb = echo.rasterize_echo(rim, pulses, bands.offsets,
+                                          bands.colours)
+        return xs, ys, rgb, 255
+
+    def band_table(self):
+        '''
+        Returns the echo.BandTable for the object's colour and the
+        band configuration of its quality level.
+        '''
+        # bands are in display pixels, so unlike the rim they don't
+        # depend on the display scale
+        key = echo.band_cache.key(self.colour, self.quality.bands,
+                                  self.quality.band_step)
+        if key == self._bands_key:
+            echo.band_cache.reuse()
+            return self._bands
+        self._bands_key = key
+        self._bands = echo.band_cache.table(key)
+        return self._bands
+
+    def collide_pulses(self, pulses, slots):
+        # check for the non-colliding cases
+        distance_sq = (pulses.x[slots] - self.x)**2 + (pulses.y[slots] - self.y)**2
+        touching = distance_sq <= (pulses.radius[slots] + self.radius)**2
+        if not touching.any():
+            return
+        if pulses.listener is not None:
+            # pulses whose ring reached the edge in the last update
+            edge = numpy.sqrt(distance_sq[touching]) - self.radius
+            reached = slots[touching]
+            reached = reached[pulses.previous_radius[reached] < edge]
+            reached = reached[pulses.alive[reached]]
+            if len(reached):
+                pulses.listener.echo(self, pulses, reached.tolist())
+        touching = slots[touching]
+        self.pulse_system = pulses
+        self.pulse_slots.update(touching[pulses.alive[touching]].tolist())
+        self.dirty = True
 
 
 class Player(CollidableObject, UpdateableObject, VisibleObject):
 
-    def __init__(self, x, y, frequency, pulse_speed=0.2):
+    def __init__(self, x, y, frequency, pulse_system, pulse_speed=0.2):
         VisibleObject.__init__(self, x, y, 0.02, 0.02)
+        self.pulse_system = pulse_system
         self.visible = False
         self.pulse_timer = 0.0
         self.frequency = frequency
         self.milliseconds_per_pulse = 1.0 / frequency * 1000.0
         self.pulse_speed = 0.2
         self.speed = 0.3
+        self.previous_position = (x, y)
+
+    @property
+    def bounding_radius(self):
+        return max(self.width, self.height) * 0.5
 
     def draw(self):
         pygame.draw.circle(self.surface, (255, 0, 0), 
                            self.surface.get_rect().center, 4)
 
     def update(self, delta_time, events):
+        self.previous_position = (self.x, self.y)
+
         # check if it is time to emit a pulse
         self.pulse_timer += delta_time
         if self.pulse_timer >= self.milliseconds_per_pulse:
             self.pulse_timer -= self.milliseconds_per_pulse
-            pygame.event.post(pygame.event.Event(
-                event.ADDPULSE,
-                pulse=Pulse(self.x, self.y, self.pulse_speed)
-            ))
+            self.pulse_system.emit(self.x, self.y, self.pulse_speed)
 
         # calculate movement from keyboard arrows
         keys_down = events['keys_down']
         move_vector = numpy.float64([0, 0])
-        # up arrow
-        if 273 in keys_down:
+        if pygame.K_UP in keys_down:
             move_vector[1] += 1
-        # down arrow
-        if 274 in keys_down:
+        if pygame.K_DOWN in keys_down:
             move_vector[1] -= 1
-        # right arrow
-        if 275 in keys_down:
+        if pygame.K_RIGHT in keys_down:
             move_vector[0] += 1
-        # left arrow
-        if 276 in keys_down:
+        if pygame.K_LEFT in keys_down:
             move_vector[0] -= 1
 
         if move_vector[0] != 0 or move_vector[1] != 0:
@@ -275,3 +642,17 @@ class Player(CollidableObject, UpdateableObject, VisibleObject):
             self.x += move_vector[0]
             self.y += move_vector[1]
             self.dirty = True
+
+    def interpolate(self, alpha):
+        self._position = (self.x, self.y)
+        previous_x, previous_y = self.previous_position
+        if (previous_x, previous_y) != self._position:
+            self.x = previous_x + (self.x - previous_x) * alpha
+            self.y = previous_y + (self.y - previous_y) * alpha
+            self.dirty = True
+
+    def end_interpolation(self):
+        if (self.x, self.y) != self._position:
+            self.x, self.y = self._position
+            # drawn at the interpolated position, not where it is now
+            self.__dict__.pop('_display_rect', None)
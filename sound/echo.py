@@ -0,0 +1,236 @@
+'''
+Echo rasterization for hidden objects. Echoes are drawn where
+the bands trailing a pulse ring cross the rim of an object. The
+coverage is computed as a NumPy mask over the object's pixels and
+written into its surface with pygame.surfarray.
+'''
+import math
+import threading
+from collections import OrderedDict
+
+import numpy
+import pygame
+
+
+# bands trail the pulse ring, they are BAND_STEP / 2 pixels apart
+BANDS = 80
+BAND_STEP = 4
+
+
+def band_offsets(bands=BANDS, step=BAND_STEP):
+    '''
+    Returns the offsets (in pixels) of the bands from the pulse ring.
+    '''
+    return numpy.arange(-bands, 0, step) * 0.5
+
+
+def band_colours(colour, bands=BANDS, step=BAND_STEP):
+    '''
+    Returns a (number of bands, 3) uint8 array with the colour of
+    every band, the middle band is the brightest.
+    '''
+    colours = []
+    for i in range(-bands, 0, step):
+        try:
+            colour_factor = 1.0 / (math.fabs(i + bands / 2.0))**0.33333
+            colours.append([int(round(c * colour_factor)) for c in colour])
+        except ZeroDivisionError:
+            colours.append(colour)
+    return numpy.uint8(colours)
+
+
+class BandTable(object):
+    '''
+    Precomputed bands of one colour and band configuration: the
+    offsets of the bands from the pulse ring and a palette with
+    the shaded colour of every band. Shared, must not be changed.
+    '''
+    __slots__ = ('offsets', 'colours')
+
+    def __init__(self, colour, bands=BANDS, step=BAND_STEP):
+        self.offsets = band_offsets(bands, step)
+        self.colours = band_colours(colour, bands, step)
+        self.offsets.setflags(write=False)
+        self.colours.setflags(write=False)
+
+
+class BandCache(object):
+    '''
+    BandTables shared between all objects with the same colour and
+    band configuration, keeping the max_tables most recently used.
+    Objects also hold on to their table (see HiddenObject), reuses
+    counts the frames they did so without a lookup (see reuse).
+    '''
+
+    def __init__(self, max_tables=1024):
+        self.max_tables = max_tables
+        self.hits = 0
+        self.misses = 0
+        self.reuses = 0
+        self._tables = OrderedDict()
+        # echoes are computed on the draw worker threads
+        self._lock = threading.Lock()
+
+    def key(self, colour, bands=BANDS, step=BAND_STEP):
+        return (tuple(colour), bands, step)
+
+    def table(self, key):
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                self.hits += 1
+                return table
+            self.misses += 1
+        table = BandTable(*key)
+        with self._lock:
+            self._tables[key] = table
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+        return table
+
+    def reuse(self):
+        '''
+        Counts a frame an object used the table it holds.
+        '''
+        with self._lock:
+            self.reuses += 1
+
+    def clear(self):
+        with self._lock:
+            self._tables.clear()
+
+
+band_cache = BandCache()
+
+
+def rim_pixels(width, height, centre_x, centre_y, radius, resolution=1.0):
+    '''
+    Returns the (xs, ys) indices of the pixels of a width x height
+    surface that are within a pixel of the circle at the centre.
+    With a resolution below 1 only that fraction of the pixels,
+    evenly spread around the circle, is returned.
+    '''
+    xs = numpy.arange(width) - centre_x
+    ys = numpy.arange(height) - centre_y
+    distance = numpy.hypot(xs[:, None], ys[None, :])
+    rim = numpy.nonzero(numpy.abs(distance - radius) <= 1.0)
+    if resolution >= 1.0:
+        return rim
+    angle = numpy.arctan2(ys[rim[1]], xs[rim[0]])
+    keep = numpy.argsort(angle, kind='stable')[::int(round(1.0 / resolution))]
+    keep.sort()
+    return rim[0][keep], rim[1][keep]
+
+
+def rasterize_echo(rim, pulses, offsets, colours):
+    '''
+    rim: (xs, ys) pixel indices returned by rim_pixels
+    pulses: (number of pulses, 3) array with the x, y and radius
+            of every pulse in pixels, relative to the surface
+    offsets: band offsets in pixels, see band_offsets
+    colours: band colours, see band_colours
+
+    Returns (xs, ys, rgb) of the rim pixels covered by a band. Later
+    pulses are drawn over earlier ones.
+    '''
+    xs, ys = rim
+    band = numpy.full(len(xs), -1)
+    if len(xs) and len(offsets):
+        spacing = offsets[1] - offsets[0] if len(offsets) > 1 else 2.0
+        dx = xs[None, :] - pulses[:, 0:1]
+        dy = ys[None, :] - pulses[:, 1:2]
+        offset = numpy.hypot(dx, dy) - pulses[:, 2:3]
+        index = numpy.rint((offset - offsets[0]) / spacing).astype(int)
+        numpy.clip(index, 0, len(offsets) - 1, out=index)
+        covered = ((offset >= offsets[0] - spacing * 0.5) &
+                   (offset <= offsets[-1] + spacing * 0.5))
+        for pulse in range(len(pulses)):
+            band[covered[pulse]] = index[pulse][covered[pulse]]
+    hit = band >= 0
+    return xs[hit], ys[hit], colours[band[hit]]
+
+
+def write_pixels(surface, xs, ys, rgb, alpha=255):
+    '''
+    Writes pixels into a per-pixel alpha surface, opaque
+    unless alpha (a value or an array) is given.
+    '''
+    if not len(xs):
+        return
+    pixels = pygame.surfarray.pixels3d(surface)
+    pixels[xs, ys] = rgb
+    del pixels
+    pixels_alpha = pygame.surfarray.pixels_alpha(surface)
+    pixels_alpha[xs, ys] = alpha
+    del pixels_alpha
+
+
+class EchoLayer(object):
+    '''
+    Persistent echo of a single object, used in incremental echo
+    mode. Holds an intensity for every rim pixel. Each frame the
+    rim pixels swept by a pulse ring since the last frame light up
+    and all others fade, so the cost depends on how far pulses move
+    rather than on the number of bands.
+
+    The sweep starts at the radius a pulse had when the layer was last
+    advanced, not on the last simulation step, as several steps can
+    run (or pipeline snapshots be dropped) between two draws.
+    '''
+    DECAY = 0.92
+    CUTOFF = 1.0 / 255
+
+    def __init__(self, decay=DECAY):
+        self.decay = decay
+        self.rim = None
+        self.intensity = None
+        self.glowing = False
+        # pulse slot -> radius in pixels when the layer was last advanced
+        self.drawn_radii = {}
+
+    def reset(self, rim):
+        self.rim = rim
+        self.intensity = numpy.zeros(len(rim[0]), dtype=numpy.float32)
+        self.glowing = False
+        self.drawn_radii = {}
+
+    def advance(self, slots, pulses):
+        '''
+        slots: pulse slots touching the object
+        pulses: (number of pulses, 3) array with the x, y and radius
+                of the pulse in every slot in pixels, relative to the
+                surface
+        '''
+        drawn_radii = self.drawn_radii
+        radii = pulses[:, 2].tolist()
+        previous_radii = numpy.empty(len(slots))
+        for i, (slot, radius) in enumerate(zip(slots, radii)):
+            previous = drawn_radii.get(slot, 0.0)
+            # a smaller radius means the slot went to a new pulse, which
+            # swept everything within its radius, like a pulse that
+            # wasn't touching the object on the last draw
+            previous_radii[i] = previous if previous <= radius else 0.0
+        # pulses that stopped touching the object are forgotten
+        self.drawn_radii = dict(zip(slots, radii))
+
+        intensity = self.intensity
+        intensity *= self.decay
+        if len(pulses) and len(intensity):
+            xs, ys = self.rim
+            distance = numpy.hypot(xs[None, :] - pulses[:, 0:1],
+                                   ys[None, :] - pulses[:, 1:2])
+            swept = ((distance >= previous_radii[:, None] - 0.5) &
+                     (distance <= pulses[:, 2:3] + 0.5))
+            intensity[swept.any(axis=0)] = 1.0
+        intensity[intensity < EchoLayer.CUTOFF] = 0.0
+        self.glowing = bool(intensity.any())
+
+    def pixels(self, colour):
+        '''
+        Returns (xs, ys, rgb, alpha) of the lit rim pixels.
+        '''
+        xs, ys = self.rim
+        lit = numpy.flatnonzero(self.intensity)
+        alpha = (self.intensity[lit] * 255).astype(numpy.uint8)
+        return xs[lit], ys[lit], numpy.uint8(colour), alpha
@@ -8,8 +8,3 @@ KEYPRESS = pygame.USEREVENT + 1
 MOUSEBUTTONDRAG = pygame.USEREVENT + 2
 MOUSEBUTTONCLICK = pygame.USEREVENT + 3
 
-
-'''
-Game-logic events
-'''
-ADDPULSE = pygame.USEREVENT + 4
@@ -0,0 +1,255 @@
+import math
+import random
+
+import pygame
+
+from sound.collision import SpatialHash
+from sound.world import World, UPDATEABLE, COLLIDABLE, VISIBLE
+from sound import event as s_event
+from sound import core
+from sound.audio import AudioSystem
+from sound.chunks import ChunkedWorld, ChunkStreamer
+from sound.instrument import instruments
+from sound.quality import QualityGovernor
+
+
+class Game(object):
+    '''
+    The game world and the phases of a single frame. Kept
+    separate from the window loop in main.py so the same
+    world can be driven headlessly (e.g. by sound.benchmark).
+    '''
+
+    def __init__(self, canvas, hidden_objects=20, seed=None, debug=False,
+                 incremental_echo=False, world_path=None, frame_budget=None,
+                 quality=0, audio=True):
+        '''
+        canvas: sound.render.Canvas the world is rendered on
+        hidden_objects: int, number of random hidden objects to generate
+        seed: seed of the world generator, None for a random world
+        debug: bool, show invisible objects in the world
+        incremental_echo: bool, hidden objects keep a decaying echo
+                          instead of redrawing all bands every frame
+        world_path: str, chunked world (see sound.chunks) whose hidden
+                    objects are streamed in around the player
+        frame_budget: float, frame time in ms the quality governor
+                      aims for, None keeps the quality level fixed
+        quality: int, index of the starting quality level
+        audio: bool, play sonar sounds (if the mixer is initialised)
+        '''
+        self.canvas = canvas
+        if seed is None:
+            seed = random.randrange(2**32)
+        # kept so the same world can be generated again
+        self.seed = seed
+        self.hidden_objects = hidden_objects
+        self.world_path = world_path
+        self.random = random.Random(seed)
+        self.debug = debug
+        self.incremental_echo = incremental_echo
+        self.governor = QualityGovernor(frame_budget, level=quality)
+        self.quality = self.governor.level
+        self.running = True
+        self.keys_down = set()
+        self.mouse_down = set()
+        self.pulse_system = core.PulseSystem()
+        self.player = core.Player(0, 0, 1.6, self.pulse_system)
+        self.world = World()
+        self.spatial_hash = SpatialHash()
+
+        self.audio = None
+
+        self.add(self.player)
+        self.add(self.pulse_system)
+        if audio:
+            # silent unless the mixer is initialised
+            self.audio = AudioSystem(self.player, self.pulse_system)
+            self.add(self.audio)
+        self.generate_hidden_objects(hidden_objects)
+        self.streamer = None
+        if world_path is not None:
+            self.streamer = ChunkStreamer(self, ChunkedWorld(world_path))
+            self.add(self.streamer)
+            self.streamer.stream()
+        self.set_debug(debug)
+
+    @property
+    def visible_objects(self):
+        return self.world.get(VISIBLE)
+
+    @property
+    def updateable_objects(self):
+        return self.world.get(UPDATEABLE)
+
+    @property
+    def collidable_objects(self):
+        return self.world.get(COLLIDABLE)
+
+    def add(self, obj):
+        obj.quality = self.quality
+        self.world.add(obj)
+        if obj in self.collidable_objects:
+            self.spatial_hash.insert(obj)
+
+    def remove(self, obj):
+        '''
+        Removes obj at the end of the frame.
+        '''
+        self.world.remove(obj)
+
+    def generate_hidden_objects(self, count, spread=1.0):
+        '''
+        Adds count random hidden objects within spread
+        world units of the origin.
+        '''
+        rand = self.random
+        for i in range(count):
+            angle = rand.random() * 2.0 * math.pi
+            distance = rand.random() * spread
+            x = distance * math.cos(angle)
+            y = distance * math.sin(angle)
+            radius = rand.random() * 0.1 + 0.05
+            colour = (rand.randint(0, 255),
+                      rand.randint(0, 255),
+                      rand.randint(0, 255))
+            obj = core.HiddenObject(x, y, radius, colour)
+            obj.incremental_echo = self.incremental_echo
+            self.add(obj)
+
+    def set_debug(self, debug):
+        self.debug = debug
+        for obj in self.world:
+            obj.debug = debug
+            obj.dirty = True
+
+    def set_quality(self, level):
+        self.quality = level
+        for obj in self.world:
+            obj.quality = level
+            obj.dirty = True
+
+    def adjust_quality(self, frame_time):
+        '''
+        Hands the time in ms of the last frame to the quality
+        governor and applies the level it picks.
+        '''
+        if self.governor.update(frame_time):
+            self.set_quality(self.governor.level)
+
+    def handle_events(self, events=None, resize=True):
+        '''
+        Processes events on the event queue (or the given
+        events). Window-level events are handled here (e.g.
+        resize and exit), unless resize is False, for callers
+        that already resized the canvas. The rest of the events
+        are added to a game events dict which game objects can use.
+        Compound events, like mouse drags, mouse clicks and
+        key presses are added to the game events dict.
+        '''
+        if events is None:
+            events = pygame.event.get()
+        keys_down = self.keys_down
+        mouse_down = self.mouse_down
+        game_events = {'keys_down': keys_down,
+                       'mouse_down': mouse_down}
+
+        for event in events:
+            # handle window events
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.VIDEORESIZE:
+                if resize:
+                    self.canvas.handle_resize(event.w, event.h)
+            # handle game events
+            else:
+                game_events.setdefault(event.type, [])
+                game_events[event.type].append(event)
+                # track KEYPRESS events
+                # KEYPRESS: KEYDOWN + KEYUP
+                if event.type == pygame.KEYDOWN:
+                    keys_down.add(event.key)
+                elif event.type == pygame.KEYUP:
+                    if event.key in keys_down:
+                        keys_down.remove(event.key)
+                        # handle window escape event
+                        if event.key == 27:
+                            self.running = False
+                        elif event.key == 100:  # toggles debug
+                            self.set_debug(not self.debug)
+                        elif event.key == 112:  # toggles profiling
+                            instruments.enabled = not instruments.enabled
+                            instruments.reset()
+                        else:
+                            game_events.setdefault(s_event.KEYPRESS, [])
+                            game_events[s_event.KEYPRESS].append(
+                                pygame.event.Event(s_event.KEYPRESS,
+                                                   key=event.key,
+                                                   mod=event.mod)
+                            )
+                # track MOUSEBUTTONDRAG and MOUSEBUTTONCLICK events
+                # MOUSEBUTTONDRAG: MOUSEBUTTONDOWN + MOUSEMOTION
+                # MOUSEBUTTONCLICK: MOUSEBUTTONDOWN + MOUSEBUTTONUP
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    mouse_down.add(event.button)
+                elif event.type == pygame.MOUSEBUTTONUP:
+                    if event.button in mouse_down:
+                        mouse_down.remove(event.button)
+                        game_events.setdefault(s_event.MOUSEBUTTONCLICK, [])
+                        game_events[s_event.MOUSEBUTTONCLICK].append(
+                            pygame.event.Event(s_event.MOUSEBUTTONCLICK,
+                                               button=event.button,
+                                               pos=event.pos)
+                        )
+                elif event.type == pygame.MOUSEMOTION:
+                    for button in mouse_down:
+                        game_events.setdefault(s_event.MOUSEBUTTONDRAG, [])
+                        game_events[s_event.MOUSEBUTTONDRAG].append(
+                            pygame.event.Event(s_event.MOUSEBUTTONDRAG,
+                                               button=button,
+                                               pos=event.pos,
+                                               rel=event.rel)
+                        )
+
+        return game_events
+
+    def update(self, delta_time, game_events):
+        collidable_objects = self.collidable_objects
+        for obj in self.updateable_objects:
+            obj.update(delta_time, game_events)
+            if obj.dead:
+                self.world.remove(obj)
+            # moving objects change cells
+            if obj in collidable_objects:
+                self.spatial_hash.update(obj)
+
+    def collide(self):
+        # only pairs sharing a spatial hash cell can collide, and
+        # objects that don't move can't run into each other
+        collidable_objects = self.collidable_objects
+        moving = [obj for obj in self.updateable_objects
+                  if obj in collidable_objects]
+        for obj1, obj2 in self.spatial_hash.candidate_pairs(moving):
+            obj1.collide(obj2)
+            obj2.collide(obj1)
+        # pulses are checked against the objects in the cells they cover
+        self.pulse_system.collide(self.spatial_hash)
+
+    def render(self, stats=(), alpha=None):
+        '''
+        alpha: float, if given objects are rendered alpha of the way
+               between their previous and current simulation state
+        '''
+        if alpha is None:
+            self.canvas.render(self.visible_objects, stats)
+            return
+        for obj in self.updateable_objects:
+            obj.interpolate(alpha)
+        try:
+            self.canvas.render(self.visible_objects, stats)
+        finally:
+            for obj in self.updateable_objects:
+                obj.end_interpolation()
+
+    def remove_dead(self):
+        for obj in self.world.flush():
+            self.spatial_hash.remove(obj)
@@ -0,0 +1,193 @@
+'''
+Per-frame profiling instrumentation. Code paths wrap their work
+in named timers and bump named counters on the shared
+`instruments` object; at the end of every frame the values are
+pushed into rolling windows (for the p50/p95/p99 shown in the stats
+overlay) and optionally written to a JSON-lines or CSV sink.
+
+When instrumentation is disabled timers and counters return
+immediately, so leaving the calls in hot paths costs next to nothing.
+'''
+import csv
+import json
+import time
+from collections import deque
+
+import numpy
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer(object):
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, *args):
+        self.instrumentation.add_time(self.name, timer() - self.start)
+        return False
+
+
+class Instrumentation(object):
+
+    def __init__(self, enabled=False, window=120, sink=None):
+        '''
+        enabled: bool, collect timers and counters
+        window: int, number of frames the percentiles are computed over
+        sink: optional object with write(record) and close() receiving
+              one dict per frame
+        '''
+        self.enabled = enabled
+        self.window = window
+        self.sink = sink
+        self.frame = 0
+        self.timers = {}
+        self.counters = {}
+        self.history = {}
+        self._counter_names = set()
+
+    def timer(self, name):
+        '''
+        Returns a context manager that adds the time spent
+        inside it to the timer called name.
+        '''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def add_time(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds * 1000.0
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def end_frame(self):
+        '''
+        Closes the current frame: pushes its timers (in ms) and
+        counters into the rolling windows and the sink.
+        '''
+        if not self.enabled:
+            return
+        # counters that weren't bumped this frame count as zero
+        self._counter_names.update(self.counters)
+        for name in self._counter_names:
+            self.counters.setdefault(name, 0)
+        for values in (self.timers, self.counters):
+            for name, value in values.items():
+                history = self.history.get(name)
+                if history is None:
+                    history = self.history[name] = deque(maxlen=self.window)
+                history.append(value)
+        if self.sink is not None:
+            self.sink.write({'frame': self.frame,
+                             'timers': self.timers,
+                             'counters': self.counters})
+        self.frame += 1
+        self.timers = {}
+        self.counters = {}
+
+    def percentiles(self, name, q=(50, 95, 99)):
+        history = self.history.get(name)
+        if not history:
+            return None
+        return numpy.percentile(numpy.float64(history), q)
+
+    def stats(self):
+        '''
+        Returns (label, value) pairs with the rolling p50/p95/p99
+        of every timer and counter, for Canvas.render_stats.
+        '''
+        stats = []
+        for name in sorted(self.history):
+            p50, p95, p99 = self.percentiles(name)
+            if isinstance(self.history[name][-1], float):
+                value = '%.2f / %.2f / %.2f ms' % (p50, p95, p99)
+            else:
+                value = '%d / %d / %d' % (p50, p95, p99)
+            stats.append((name, value))
+        return stats
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+        self.history = {}
+        self._counter_names = set()
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+
+class JsonLinesSink(object):
+    '''
+    Writes one JSON object per frame.
+    '''
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, record):
+        self.file.write(json.dumps(record, sort_keys=True))
+        self.file.write('\n')
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink(object):
+    '''
+    Writes one (frame, name, value) row per timer and counter of
+    every frame, so names that first show up in later frames are
+    kept. Only the given fields are written if there are any.
+    '''
+
+    def __init__(self, path, fields=None):
+        self.file = open(path, 'w')
+        self.fields = None if fields is None else set(fields)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(('frame', 'name', 'value'))
+
+    def write(self, record):
+        frame = record['frame']
+        fields = self.fields
+        for values in (record['timers'], record['counters']):
+            for name in sorted(values):
+                if fields is None or name in fields:
+                    self.writer.writerow((frame, name, values[name]))
+
+    def close(self):
+        self.file.close()
+
+
+def open_sink(path):
+    '''
+    Returns a CsvSink for .csv paths and a JsonLinesSink otherwise.
+    '''
+    if path.lower().endswith('.csv'):
+        return CsvSink(path)
+    return JsonLinesSink(path)
+
+
+# instrumentation shared by the whole game
+instruments = Instrumentation()
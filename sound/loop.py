@@ -0,0 +1,216 @@
+import time
+
+import pygame
+
+from sound.instrument import instruments
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class GameLoop(object):
+    '''
+    Fixed timestep game loop. The simulation always advances in
+    steps of step_time ms, however long rendering takes, and
+    rendering runs at its own rate, interpolating between the last
+    two simulation states. When the simulation can't keep up it
+    runs at most max_steps steps per tick (dropping the rest of the
+    time) and skips up to max_frame_skip renders in a row.
+    '''
+    # whether window resize events resize the canvas when the
+    # simulation handles them
+    RESIZE_CANVAS = True
+
+    def __init__(self, game, step_time=1000.0 / 120, render_rate=60,
+                 max_steps=5, max_frame_skip=5, stats=None, recorder=None,
+                 show_stats=True):
+        '''
+        game: sound.game.Game
+        step_time: float, ms simulated by every step
+        render_rate: float, maximum frames rendered per second,
+                     None renders on every tick
+        max_steps: int, maximum number of steps simulated per tick
+        max_frame_skip: int, maximum number of renders skipped in a row
+        stats: callable returning extra (label, value) stats
+        recorder: sound.replay.Recorder every tick's input is written to
+        show_stats: bool, False leaves out the stats overlay, whose
+                    timings differ from run to run
+        '''
+        self.game = game
+        self.step_time = step_time
+        self.render_rate = render_rate
+        self.max_steps = max_steps
+        self.max_frame_skip = max_frame_skip
+        self.stats = stats
+        self.recorder = recorder
+        self.show_stats = show_stats
+        self.accumulator = 0.0
+        self.fps = 0.0
+        self.frame_time = 0.0
+        self.steps = 0
+        self.frames = 0
+        self.skipped_frames = 0
+        self.dropped_time = 0.0
+        self._last_time = None
+        self._last_render = None
+        self._frame_skip = 0
+        self._fps_frames = 0
+        self._fps_time = None
+        self._pending_events = None
+
+    @property
+    def render_interval(self):
+        if not self.render_rate:
+            return 0.0
+        return 1.0 / self.render_rate
+
+    def run(self):
+        while self.game.running:
+            self.tick()
+            self.wait()
+
+    def tick(self, elapsed=None, events=None):
+        '''
+        Handles events, simulates as many steps as have accumulated
+        and renders if a frame is due. elapsed is the time in ms since
+        the last tick, measured if not given, and events are taken
+        from the event queue if not given. Returns True if a frame
+        was rendered.
+        '''
+        now = timer()
+        elapsed = self._advance_clock(now, elapsed)
+        with instruments.timer('events'):
+            if events is None:
+                events = pygame.event.get()
+            self._handle_events(elapsed, events)
+
+        if self._run_steps() and self._frame_skip < self.max_frame_skip:
+            self._frame_skip += 1
+            self.skipped_frames += 1
+            return False
+
+        if (self._last_render is not None and
+                now - self._last_render < self.render_interval):
+            return False
+        self.render(now)
+        # the governor is given the work done in the tick, not the
+        # time between frames, which includes waiting
+        self.game.adjust_quality((timer() - now) * 1000.0)
+        return True
+
+    def _advance_clock(self, now, elapsed=None):
+        '''
+        Adds the time since the last tick to the accumulator, elapsed
+        ms if given, and returns it.
+        '''
+        if elapsed is None:
+            if self._last_time is None:
+                elapsed = 0.0
+            else:
+                elapsed = (now - self._last_time) * 1000.0
+        self._last_time = now
+        self.accumulator += elapsed
+        return elapsed
+
+    def _handle_events(self, elapsed, events):
+        if self.recorder is not None:
+            self.recorder.record(elapsed, events, self.game.governor.index)
+        self._queue_events(self.game.handle_events(events,
+                                                   self.RESIZE_CANVAS))
+
+    def _run_steps(self):
+        '''
+        Simulates the steps that have accumulated, at most max_steps.
+        Returns True if the simulation couldn't keep up.
+        '''
+        steps = 0
+        while self.accumulator >= self.step_time and steps < self.max_steps:
+            self.simulate()
+            self.accumulator -= self.step_time
+            steps += 1
+        if self.accumulator < self.step_time:
+            return False
+        # drop the time we can't catch up on, the game slows
+        # down instead of spiralling into ever longer ticks
+        dropped = self.accumulator - self.accumulator % self.step_time
+        self.dropped_time += dropped
+        self.accumulator -= dropped
+        return True
+
+    def simulate(self):
+        game = self.game
+        game_events = self._pending_events
+        self._pending_events = None
+        if game_events is None:
+            game_events = {'keys_down': game.keys_down,
+                           'mouse_down': game.mouse_down}
+        with instruments.timer('update'):
+            game.update(self.step_time, game_events)
+        with instruments.timer('collision'):
+            game.collide()
+        game.remove_dead()
+        self.steps += 1
+
+    def render(self, now):
+        self._count_frame(now)
+        self._frame_skip = 0
+        stats = self._frame_stats(
+            self.steps, '%d frames skipped' % self.skipped_frames,
+            self.game.governor.describe())
+        self.game.render(stats, self.accumulator / self.step_time)
+        instruments.end_frame()
+
+    def _count_frame(self, now):
+        '''
+        Updates the frame time and the FPS, measured over a second.
+        '''
+        if self._last_render is not None:
+            self.frame_time = (now - self._last_render) * 1000.0
+        self._last_render = now
+        self.frames += 1
+
+        self._fps_frames += 1
+        if self._fps_time is None:
+            self._fps_time = now
+        elif now - self._fps_time >= 1.0:
+            self.fps = self._fps_frames / (now - self._fps_time)
+            self._fps_frames = 0
+            self._fps_time = now
+
+    def _frame_stats(self, steps, dropped, quality):
+        '''
+        Returns the stats overlay lines, empty unless show_stats.
+        dropped describes the work dropped to keep up.
+        '''
+        if not self.show_stats:
+            return []
+        stats = [('FPS', self.fps),
+                 ('Frame time', '%.1f ms' % self.frame_time),
+                 ('Sim steps', '%d (%s)' % (steps, dropped)),
+                 ('Quality', quality)]
+        if self.stats is not None:
+            stats.extend(self.stats())
+        return stats
+
+    def wait(self):
+        '''
+        Sleeps until the next step or frame is due.
+        '''
+        now = timer()
+        wait = (self.step_time - self.accumulator) / 1000.0
+        if self._last_render is not None and self.render_interval:
+            wait = min(wait, self._last_render + self.render_interval - now)
+        wait -= now - self._last_time
+        if wait > 0:
+            time.sleep(wait)
+
+    def _queue_events(self, game_events):
+        # one-off events are handed to the next simulation step,
+        # even if no step runs in this tick
+        if self._pending_events is None:
+            self._pending_events = game_events
+            return
+        for key, value in game_events.items():
+            if key in ('keys_down', 'mouse_down'):
+                continue
+            self._pending_events.setdefault(key, []).extend(value)
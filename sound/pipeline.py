@@ -0,0 +1,238 @@
+'''
+Pipelined game loop: the simulation runs on its own thread while
+the main thread renders, so render time no longer adds to the
+latency of the simulation.
+
+Ownership: the simulation thread owns the game and its objects, the
+render thread owns the canvas and a mirror of every visible object
+(see VisibleObject.mirror). After every tick the simulation thread
+publishes an immutable Snapshot with the state the renderer reads
+(positions, radii, pulse arrays and a version that changes when an
+object was marked dirty). The render thread applies the latest
+snapshot to its mirrors and draws them, so surfaces, echo layers and
+the surface pool are only ever touched by the render thread.
+
+Snapshots go through a SnapshotBuffer. With one snapshot being
+rendered, one waiting and one being built it works as a triple
+buffer: the simulation never waits for the renderer, and a snapshot
+that wasn't rendered in time is replaced by the next one.
+'''
+import time
+import threading
+
+import pygame
+
+from sound.loop import GameLoop, timer
+from sound.instrument import instruments
+
+
+class Snapshot(object):
+    '''
+    State of the visible objects after a simulation tick. Must
+    not be changed once published.
+    '''
+    __slots__ = ('entries', 'mirrors', 'steps', 'quality')
+
+    def __init__(self, entries, mirrors, steps, quality):
+        '''
+        entries: tuple of (object, values, version), see
+                 VisibleObject.snapshot, in drawing order
+        mirrors: dict of object -> mirror for objects new in
+                 this snapshot
+        steps: int, simulation steps run so far
+        quality: str, description of the quality level
+        '''
+        self.entries = entries
+        self.mirrors = mirrors
+        self.steps = steps
+        self.quality = quality
+
+
+def take_snapshot(game, published, alpha=None, steps=0):
+    '''
+    Builds a snapshot of game on the simulation thread, with objects
+    interpolated alpha of the way from their previous state. published
+    is the set of objects that already have a mirror, and is updated.
+    '''
+    updateable = game.updateable_objects
+    if alpha is not None:
+        for obj in updateable:
+            obj.interpolate(alpha)
+    try:
+        entries = []
+        mirrors = {}
+        for obj in game.visible_objects:
+            if obj not in published:
+                mirrors[obj] = obj.mirror()
+            values, version = obj.snapshot()
+            entries.append((obj, values, version))
+    finally:
+        if alpha is not None:
+            for obj in updateable:
+                obj.end_interpolation()
+    published.clear()
+    published.update(entry[0] for entry in entries)
+    return Snapshot(tuple(entries), mirrors, steps, game.governor.describe())
+
+
+class SnapshotBuffer(object):
+    '''
+    Hands the latest snapshot from the simulation thread
+    to the render thread.
+    '''
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._latest = None
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, snapshot):
+        with self._condition:
+            previous = self._latest
+            if previous is not None:
+                # not rendered in time, but its new mirrors are needed
+                self.dropped += 1
+                for obj, mirror in previous.mirrors.items():
+                    snapshot.mirrors.setdefault(obj, mirror)
+            self._latest = snapshot
+            self.published += 1
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        '''
+        Returns the latest snapshot, waiting up to timeout
+        seconds for one. Returns None if there is none.
+        '''
+        with self._condition:
+            if self._latest is None:
+                self._condition.wait(timeout)
+            snapshot = self._latest
+            self._latest = None
+            return snapshot
+
+
+class SnapshotRenderer(object):
+    '''
+    Keeps the mirrors of the visible objects on the render thread.
+    '''
+
+    def __init__(self):
+        self.mirrors = {}
+        self.objects = []
+
+    def apply(self, snapshot):
+        mirrors = self.mirrors
+        mirrors.update(snapshot.mirrors)
+        objects = []
+        current = {}
+        for obj, values, version in snapshot.entries:
+            mirror = current[obj] = mirrors[obj]
+            mirror.apply_snapshot(values, version)
+            objects.append(mirror)
+        for mirror in objects:
+            for name in mirror.SNAPSHOT_REFERENCES:
+                setattr(mirror, name, current.get(getattr(mirror, name)))
+        # mirrors of removed objects are dropped
+        self.mirrors = current
+        self.objects = objects
+        return objects
+
+
+class PipelinedLoop(GameLoop):
+    '''
+    GameLoop whose simulation runs on a separate thread, see
+    the module docstring. The thread calling run renders and
+    handles the window events.
+    '''
+    # the canvas is resized on the render thread, see pump_events
+    RESIZE_CANVAS = False
+
+    def __init__(self, game, *args, **kwargs):
+        super(PipelinedLoop, self).__init__(game, *args, **kwargs)
+        self.buffer = SnapshotBuffer()
+        self.renderer = SnapshotRenderer()
+        self.render_time = 0.0
+        self._published = set()
+        self._events = []
+        self._events_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+
+    def run(self):
+        self._thread = threading.Thread(target=self.simulate_forever,
+                                        name='simulation')
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            while self.game.running and self._thread.is_alive():
+                self.pump_events()
+                snapshot = self.buffer.take(self.render_interval or 0.05)
+                if snapshot is not None:
+                    self.render_snapshot(snapshot)
+                    self.wait_for_frame()
+        finally:
+            self._stopped = True
+            self._thread.join()
+
+    def pump_events(self):
+        '''
+        Takes the window events on the render thread, resizes
+        the canvas and passes them on to the simulation, resizes
+        included so they are recorded.
+        '''
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.VIDEORESIZE:
+                self.game.canvas.handle_resize(event.w, event.h)
+        with self._events_lock:
+            self._events.extend(events)
+
+    def simulate_forever(self):
+        while self.game.running and not self._stopped:
+            self.simulate_tick()
+            # sleep until the next step is due
+            wait = ((self.step_time - self.accumulator) / 1000.0 -
+                    (timer() - self._last_time))
+            if wait > 0:
+                time.sleep(wait)
+
+    def simulate_tick(self, elapsed=None, events=None):
+        '''
+        One tick of the simulation thread: handles the events passed
+        on by the render thread (or the given events), runs the steps
+        that are due and publishes a snapshot.
+        '''
+        now = timer()
+        elapsed = self._advance_clock(now, elapsed)
+        if events is None:
+            with self._events_lock:
+                events = self._events
+                self._events = []
+        self._handle_events(elapsed, events)
+        self._run_steps()
+
+        self.buffer.publish(take_snapshot(
+            self.game, self._published, self.accumulator / self.step_time,
+            self.steps))
+        # a frame takes as long as the slower of the two threads
+        self.game.adjust_quality(max((timer() - now) * 1000.0,
+                                     self.render_time))
+
+    def render_snapshot(self, snapshot):
+        now = timer()
+        self._count_frame(now)
+        stats = self._frame_stats(
+            snapshot.steps, '%d snapshots dropped' % self.buffer.dropped,
+            snapshot.quality)
+        objects = self.renderer.apply(snapshot)
+        self.game.canvas.render(objects, stats)
+        self.render_time = (timer() - now) * 1000.0
+        instruments.end_frame()
+
+    def wait_for_frame(self):
+        if not self.render_interval:
+            return
+        wait = self._last_render + self.render_interval - timer()
+        if wait > 0:
+            time.sleep(wait)
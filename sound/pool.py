@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+import pygame
+
+from sound.instrument import instruments
+
+
+class SurfacePool(object):
+    '''
+    Reuses offscreen surfaces instead of allocating new
+    ones. Surfaces are bucketed by size (rounded up to a
+    multiple of bucket_size) and handed out as cleared
+    subsurfaces of the requested size. Released surfaces
+    are kept until max_bytes is reached, after which the
+    least recently released ones are evicted.
+    '''
+
+    def __init__(self, bucket_size=32, max_bytes=128 * 1024 * 1024):
+        self.bucket_size = bucket_size
+        self.max_bytes = max_bytes
+        self.pooled_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bucket key -> list of free surfaces
+        self._free = {}
+        # free surfaces in release order, for eviction
+        self._lru = OrderedDict()
+
+    def bucket(self, width, height, flags):
+        size = self.bucket_size
+        return (-(-width // size) * size, -(-height // size) * size, flags)
+
+    def acquire(self, width, height, flags=0):
+        '''
+        Returns a cleared surface of exactly width x height.
+        '''
+        width = int(width)
+        height = int(height)
+        key = self.bucket(max(width, 1), max(height, 1), flags)
+        free = self._free.get(key)
+        if free:
+            parent = free.pop()
+            del self._lru[id(parent)]
+            self.pooled_bytes -= self._bytes(parent)
+            self.hits += 1
+        else:
+            parent = pygame.Surface(key[:2], flags)
+            self.misses += 1
+            instruments.count('surfaces allocated')
+
+        surface = parent.subsurface((0, 0, width, height))
+        if flags & pygame.SRCALPHA:
+            surface.fill((0, 0, 0, 0))
+        else:
+            surface.fill((0, 0, 0))
+        return surface
+
+    def release(self, surface):
+        '''
+        Hands a surface returned by acquire back to the pool.
+        '''
+        parent = surface.get_parent()
+        if parent is None or id(parent) in self._lru:
+            return
+        key = (parent.get_width(), parent.get_height(),
+               parent.get_flags() & pygame.SRCALPHA)
+        self._free.setdefault(key, []).append(parent)
+        self._lru[id(parent)] = (key, parent)
+        self.pooled_bytes += self._bytes(parent)
+        self.evict(self.max_bytes)
+
+    def evict(self, max_bytes=0):
+        '''
+        Drops the least recently released surfaces until
+        the pool holds at most max_bytes.
+        '''
+        while self.pooled_bytes > max_bytes and self._lru:
+            _, (key, parent) = self._lru.popitem(last=False)
+            self._free[key].remove(parent)
+            if not self._free[key]:
+                del self._free[key]
+            self.pooled_bytes -= self._bytes(parent)
+            self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+    def _bytes(self, surface):
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+# pool shared by all visible objects
+default_pool = SurfacePool()
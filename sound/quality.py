@@ -0,0 +1,109 @@
+'''
+Level-of-detail control. A QualityLevel bundles the knobs that
+trade image quality for frame time, and the QualityGovernor steps
+between levels to keep recent frame times within a budget.
+'''
+from collections import deque
+
+
+class QualityLevel(object):
+
+    def __init__(self, name, bands=80, band_step=4, echo_resolution=1.0,
+                 min_echo_size=0, max_pulses=None, pulse_radius=0.5):
+        '''
+        name: str, shown in the stats overlay
+        bands, band_step: bands trailing every pulse, see sound.echo
+        echo_resolution: float, fraction of an object's rim pixels
+                         the echo is drawn on
+        min_echo_size: int, objects smaller than this many pixels on
+                       screen don't draw echoes
+        max_pulses: int, maximum number of live pulses, None for no cap
+        pulse_radius: float, world units a pulse travels before expiring
+        '''
+        self.name = name
+        self.bands = bands
+        self.band_step = band_step
+        self.echo_resolution = echo_resolution
+        self.min_echo_size = min_echo_size
+        self.max_pulses = max_pulses
+        self.pulse_radius = pulse_radius
+
+    def __repr__(self):
+        return 'QualityLevel(%r)' % self.name
+
+
+# from best looking to cheapest
+LEVELS = (
+    QualityLevel('high'),
+    QualityLevel('medium', band_step=8, min_echo_size=8, max_pulses=64),
+    QualityLevel('low', bands=60, band_step=8, echo_resolution=0.5,
+                 min_echo_size=16, max_pulses=32, pulse_radius=0.4),
+    QualityLevel('lowest', bands=40, band_step=10, echo_resolution=0.25,
+                 min_echo_size=24, max_pulses=16, pulse_radius=0.3),
+)
+
+
+class QualityGovernor(object):
+    '''
+    Watches frame times and lowers the quality level when they run
+    over budget, raising it again once there is headroom. Levels
+    only change after a full window of frames at the current level.
+    '''
+
+    def __init__(self, frame_budget=None, levels=LEVELS, level=0,
+                 min_level=0, max_level=None, window=30, headroom=0.75):
+        '''
+        frame_budget: float, target frame time in ms, None keeps
+                      the level fixed
+        levels: QualityLevels from best to cheapest
+        level: int, index of the starting level
+        min_level, max_level: int, range of levels the governor may
+                              pick, max_level defaults to the last one
+        window: int, number of frames averaged before changing level
+        headroom: float, fraction of the budget frames have to stay
+                  under before the quality is raised
+        '''
+        self.frame_budget = frame_budget
+        self.levels = levels
+        self.min_level = min_level
+        self.max_level = len(levels) - 1 if max_level is None else max_level
+        self.index = max(self.min_level, min(level, self.max_level))
+        self.headroom = headroom
+        self.frame_times = deque(maxlen=window)
+        self.changes = 0
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def set_level(self, index):
+        self.index = max(self.min_level, min(index, self.max_level))
+        self.frame_times.clear()
+
+    def update(self, frame_time):
+        '''
+        Records the time in ms of a frame. Returns True if
+        the level changed.
+        '''
+        if self.frame_budget is None:
+            return False
+        frame_times = self.frame_times
+        frame_times.append(frame_time)
+        if len(frame_times) < frame_times.maxlen:
+            return False
+
+        mean = sum(frame_times) / len(frame_times)
+        index = self.index
+        if mean > self.frame_budget and index < self.max_level:
+            index += 1
+        elif mean < self.frame_budget * self.headroom and index > self.min_level:
+            index -= 1
+        else:
+            return False
+        self.set_level(index)
+        self.changes += 1
+        return True
+
+    def describe(self):
+        return '%s (%d/%d)' % (self.level.name, self.index,
+                               len(self.levels) - 1)
@@ -0,0 +1,329 @@
+'''
+Regression suite for the render and simulation code. Runs headless
+under the SDL dummy drivers.
+
+Benchmarks: micro-benchmarks of single code paths (echo
+rasterization, the echo of one hidden object, the stats overlay) and
+macro scenes of N hidden objects x M live pulses. Results are saved as
+JSON, and a later run fails when a benchmark got slower than the
+baseline by more than the tolerance.
+
+    python -m sound.regression bench -o baseline.json
+    python -m sound.regression bench --baseline baseline.json --tolerance 0.15
+
+Golden frames: seeded scenes with scripted input are rendered and
+compared pixel for pixel with saved frames, through every render path
+that should draw the same thing (dirty rects, draw workers, the
+pipelined loop), so faster code paths are proven to render the same
+echoes.
+
+    python -m sound.regression golden save golden/
+    python -m sound.regression golden check golden/
+'''
+import os
+import sys
+import json
+import argparse
+
+import numpy
+import pygame
+
+from sound.benchmark import (add_compare_arguments, compare_timings,
+                             init_headless, report_regressions,
+                             scripted_input, seed_pulses, summarize, timer)
+
+
+# (name, hidden objects, pulses)
+SCENES = (
+    ('scene 20x4', 20, 4),
+    ('scene 20x16', 20, 16),
+    ('scene 200x4', 200, 4),
+    ('scene 200x16', 200, 16),
+)
+
+# (name, hidden objects, pulses) of the golden frame scenes
+GOLDEN_SCENES = (
+    ('echoes', 20, 6),
+    ('dense', 100, 12),
+)
+# render paths that have to match the golden frames, as Canvas
+# options and whether the pipelined loop is used
+RENDER_PATHS = (
+    ('full', {}, False),
+    ('dirty rects', {'dirty_rects': True}, False),
+    ('draw workers', {'draw_workers': 2}, False),
+    ('pipelined', {'dirty_rects': True}, True),
+)
+GOLDEN_SIZE = (400, 400)
+GOLDEN_FRAMES = 120
+# every how many frames one is kept
+GOLDEN_STRIDE = 10
+
+
+def measure(func, repeat=50, warmup=5):
+    '''
+    Calls func warmup + repeat times and returns the
+    summary of the times in ms of the last repeat calls.
+    '''
+    samples = []
+    for i in range(warmup + repeat):
+        start = timer()
+        func()
+        if i >= warmup:
+            samples.append((timer() - start) * 1000.0)
+    return summarize(samples)
+
+
+def bench_rasterization(repeat, size=200, pulses=8):
+    '''
+    Times the echo rasterization of an object size pixels across hit
+    by pulses: its rim, the banded echo and the incremental echo.
+    '''
+    from sound import echo
+
+    centre = radius = size / 2.0 - 1
+    rim = echo.rim_pixels(size, size, centre, centre, radius)
+    bands = echo.BandTable((200, 120, 40))
+    # pulses from the left of the object, staggered across it
+    ring = numpy.empty((pulses, 3))
+    ring[:, 0] = -size
+    ring[:, 1] = centre
+    ring[:, 2] = size + numpy.arange(pulses) * size / float(pulses)
+    slots = list(range(pulses))
+    layer = echo.EchoLayer()
+    layer.reset(rim)
+    moving = ring.copy()
+    calls = [0]
+
+    def advance():
+        # pulses grow 2 pixels a call, like a pulse between two frames
+        calls[0] += 1
+        moving[:, 2] = ring[:, 2] + calls[0] % 50 * 2.0
+        layer.advance(slots, moving)
+
+    return {
+        'rim_pixels %dpx' % size: measure(
+            lambda: echo.rim_pixels(size, size, centre, centre, radius),
+            repeat),
+        'rasterize_echo %d pulses' % pulses: measure(
+            lambda: echo.rasterize_echo(rim, ring, bands.offsets,
+                                        bands.colours), repeat),
+        'EchoLayer.advance %d pulses' % pulses: measure(advance, repeat),
+    }
+
+
+def bench_echo(repeat, pulses=8):
+    '''
+    Redraws the echo of a single hidden object hit by pulses.
+    '''
+    from sound.camera import Camera
+    from sound import core
+
+    camera = Camera(900, 900)
+    surface = pygame.Surface((900, 900))
+    pulse_system = core.PulseSystem()
+    obj = core.HiddenObject(0.3, 0.1, 0.15, (200, 120, 40))
+    slots = [pulse_system.emit(0.0, 0.0, 0.2) for _ in range(pulses)]
+    for i, slot in enumerate(slots):
+        pulse_system.radius[slot] = 0.2 + 0.2 * i / pulses
+
+    def draw():
+        obj.collide_pulses(pulse_system, numpy.array(slots))
+        obj.pre_render(camera)
+        obj.render(surface)
+
+    return {'echo draw %d pulses' % pulses: measure(draw, repeat)}
+
+
+def bench_stats(repeat):
+    from sound.render import Canvas
+
+    canvas = Canvas(900, 900, offscreen=True)
+    rand = numpy.random.RandomState(0)
+
+    def render_stats():
+        values = rand.uniform(0, 100, 8)
+        canvas.render_stats([('stat %d' % i, '%.2f ms' % value)
+                             for i, value in enumerate(values)])
+
+    return {'stats overlay 8 lines': measure(render_stats, repeat)}
+
+
+def bench_scenes(frames, warmup):
+    from sound import benchmark
+
+    results = {}
+    for name, hidden_objects, pulses in SCENES:
+        result = benchmark.run(hidden_objects=hidden_objects, pulses=pulses,
+                               frames=frames, warmup=warmup)
+        results[name] = result['frame']
+    return results
+
+
+def bench(repeat=50, frames=120, warmup=20):
+    '''
+    Runs every benchmark and returns the result, see save/compare.
+    '''
+    init_headless()
+    results = {}
+    results.update(bench_rasterization(repeat))
+    results.update(bench_echo(repeat))
+    results.update(bench_stats(repeat))
+    results.update(bench_scenes(frames, warmup))
+    return {
+        'config': {'repeat': repeat, 'frames': frames, 'warmup': warmup},
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.1, statistic='p50',
+            min_delta=0.05):
+    '''
+    Compares two bench results, see benchmark.compare_timings.
+    '''
+    return compare_timings(baseline['results'], current['results'],
+                           tolerance, statistic, min_delta)
+
+
+def print_results(result, out=sys.stdout):
+    out.write('%-30s %8s %8s %8s %8s\n'
+              % ('benchmark (ms)', 'mean', 'p50', 'p95', 'max'))
+    for name in sorted(result['results']):
+        stats = result['results'][name]
+        out.write('%-30s %8.3f %8.3f %8.3f %8.3f\n'
+                  % (name, stats['mean'], stats['p50'], stats['p95'],
+                     stats['max']))
+
+
+def render_frames(hidden_objects, pulses, canvas_options={}, pipelined=False,
+                  frames=GOLDEN_FRAMES, stride=GOLDEN_STRIDE, seed=0):
+    '''
+    Renders a seeded scene with scripted input, one simulation step
+    per frame, and returns every stride-th frame as a (height, width, 3)
+    array.
+    '''
+    from sound.render import Canvas
+    from sound.game import Game
+    from sound.loop import GameLoop
+    from sound.pipeline import PipelinedLoop
+
+    init_headless()
+    width, height = GOLDEN_SIZE
+    canvas = Canvas(width, height, background=(0, 0, 0), offscreen=True,
+                    **canvas_options)
+    game = Game(canvas, hidden_objects=hidden_objects, seed=seed, audio=False)
+    seed_pulses(game, pulses)
+    loop_class = PipelinedLoop if pipelined else GameLoop
+    loop = loop_class(game, render_rate=None, show_stats=False)
+
+    kept = []
+    for frame, events in enumerate(scripted_input(frames, seed)):
+        if pipelined:
+            # lockstep: every snapshot is rendered before the next tick
+            loop.simulate_tick(loop.step_time, events)
+            loop.render_snapshot(loop.buffer.take(0))
+        else:
+            loop.tick(loop.step_time, events)
+        if frame % stride == 0:
+            kept.append(pygame.surfarray.array3d(canvas.display).swapaxes(0, 1))
+    if canvas.draw_executor is not None:
+        canvas.draw_executor.shutdown()
+    return kept
+
+
+def save_golden(directory):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name, hidden_objects, pulses in GOLDEN_SCENES:
+        frames = render_frames(hidden_objects, pulses)
+        numpy.savez_compressed(
+            os.path.join(directory, '%s.npz' % name.replace(' ', '_')),
+            *frames)
+        sys.stdout.write('%s: saved %d frames\n' % (name, len(frames)))
+
+
+def check_golden(directory, max_pixels=0):
+    '''
+    Renders the golden scenes through every render path and returns
+    a list of (scene, render path, frame index, differing pixels) for
+    the frames that differ from the saved ones in more than
+    max_pixels pixels.
+    '''
+    failures = []
+    for name, hidden_objects, pulses in GOLDEN_SCENES:
+        path = os.path.join(directory, '%s.npz' % name.replace(' ', '_'))
+        with numpy.load(path) as data:
+            golden = [data['arr_%d' % i] for i in range(len(data.files))]
+        for path_name, canvas_options, pipelined in RENDER_PATHS:
+            frames = render_frames(hidden_objects, pulses, canvas_options,
+                                   pipelined)
+            if len(frames) != len(golden):
+                failures.append((name, path_name, None, None))
+                continue
+            for i, (expected, frame) in enumerate(zip(golden, frames)):
+                differing = int(numpy.count_nonzero((expected != frame).any(2)))
+                if differing > max_pixels:
+                    failures.append((name, path_name, i * GOLDEN_STRIDE,
+                                     differing))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render and simulation '
+                                     'regression suite')
+    commands = parser.add_subparsers(dest='command')
+
+    bench_parser = commands.add_parser('bench', help='run the benchmarks')
+    bench_parser.add_argument('--repeat', type=int, default=50,
+                              help='calls timed per micro-benchmark')
+    bench_parser.add_argument('--frames', type=int, default=120,
+                              help='frames timed per scene')
+    bench_parser.add_argument('--warmup', type=int, default=20)
+    bench_parser.add_argument('-o', '--output', help='save the results as JSON')
+    bench_parser.add_argument('--baseline', help='JSON results to compare '
+                              'with, exits with 1 on regressions')
+    add_compare_arguments(bench_parser)
+
+    golden_parser = commands.add_parser('golden', help='save or check '
+                                        'golden frames')
+    golden_parser.add_argument('action', choices=('save', 'check'))
+    golden_parser.add_argument('directory')
+    golden_parser.add_argument('--max-pixels', type=int, default=0,
+                               help='differing pixels allowed per frame')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        result = bench(args.repeat, args.frames, args.warmup)
+        print_results(result)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            return report_regressions(compare(baseline, result, args.tolerance,
+                                              args.statistic, args.min_delta))
+        return 0
+    elif args.command == 'golden':
+        if args.action == 'save':
+            save_golden(args.directory)
+            return 0
+        failures = check_golden(args.directory, args.max_pixels)
+        for scene, path_name, frame, differing in failures:
+            if frame is None:
+                sys.stdout.write('%s, %s: wrong number of frames\n'
+                                 % (scene, path_name))
+            else:
+                sys.stdout.write('%s, %s: frame %d differs in %d pixels\n'
+                                 % (scene, path_name, frame, differing))
+        if failures:
+            return 1
+        sys.stdout.write('all frames match\n')
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,73 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import pygame
 
+from sound.camera import Camera
+from sound.instrument import instruments
+from sound.pool import default_pool
+
+
+class TextCache(object):
+    '''
+    Caches rendered text with LRU eviction. Whole labels are
+    cached as one surface, values that change every frame
+    (numbers mostly) are composed from cached glyph surfaces
+    so a new value doesn't need a font.render call.
+    '''
+
+    def __init__(self, font, colour, max_labels=256, max_glyphs=256):
+        self.font = font
+        self.colour = colour
+        self.max_labels = max_labels
+        self.max_glyphs = max_glyphs
+        self.hits = 0
+        self.misses = 0
+        self._labels = OrderedDict()
+        self._glyphs = OrderedDict()
+
+    def _get(self, cache, limit, text):
+        surface = cache.pop(text, None)
+        if surface is None:
+            surface = self.font.render(text, True, self.colour)
+            self.misses += 1
+            if len(cache) >= limit:
+                cache.popitem(last=False)
+        else:
+            self.hits += 1
+        # most recently used entries are kept at the end
+        cache[text] = surface
+        return surface
+
+    def label(self, text):
+        return self._get(self._labels, self.max_labels, text)
+
+    def glyph(self, char):
+        return self._get(self._glyphs, self.max_glyphs, char)
+
+    def glyphs(self, text):
+        return [self.glyph(char) for char in text]
+
+    def size(self, text):
+        glyphs = self.glyphs(text)
+        return (sum(glyph.get_width() for glyph in glyphs),
+                max([glyph.get_height() for glyph in glyphs] or [0]))
+
+    def blit_glyphs(self, surface, glyphs, position):
+        x, y = position
+        for glyph in glyphs:
+            surface.blit(glyph, (x, y))
+            x += glyph.get_width()
+        return x
+
+    def clear(self):
+        self._labels.clear()
+        self._glyphs.clear()
+
+
+def _prepare_draw(obj):
+    obj.prepare_draw()
+
 
 class Canvas(object):
     FONT_NAMES = 'ubuntu,arial'
@@ -8,84 +76,297 @@ class Canvas(object):
     STATS_BACKGROUND = (0, 0, 0)
     DISPLAY_FLAGS = pygame.HWSURFACE
 
-    def __init__(self, width, height, background=(64, 64, 64)):
+    def __init__(self, width, height, background=(64, 64, 64),
+                 dirty_rects=False, dirty_threshold=0.5, draw_workers=0,
+                 offscreen=False, render_scale=1.0, render_size=None,
+                 smooth_scale=False):
+        '''
+        dirty_rects: bool, only redraw and present the regions of the
+                     display that changed since the last frame
+        dirty_threshold: float, fraction of the display area above
+                         which a dirty frame is redrawn in full
+        draw_workers: int, number of threads preparing the drawing of
+                      dirty objects in parallel, 0 draws everything
+                      on the calling thread
+        offscreen: bool, render to a plain surface instead of the
+                   display, so there can be many canvases per process
+        render_scale: float, fraction of the display size the world is
+                      rendered at before being scaled up to the display
+        render_size: (width, height) the world is rendered at, instead
+                     of a fraction of the display size
+        smooth_scale: bool, filter the world when scaling it up instead
+                      of repeating pixels
+        '''
         self.width = width
         self.height = height
-        self.surface = pygame.display.set_mode((width, height),
-                                               Canvas.DISPLAY_FLAGS)
+        self.offscreen = offscreen
+        # the display (or the offscreen surface standing in for it)
+        # and the surface the world is rendered on, the same
+        # surface unless the world is rendered at a lower resolution
+        self.display = self.create_surface(width, height)
+        self.surface = self.display
+        self.camera = Camera(width, height)
         self.background = background
         self.background_image = None
-        if type(self.background) not in (tuple, list):
-            self.scale_background_image()
+        self.smooth_scale = smooth_scale
         self.font = pygame.font.SysFont(Canvas.FONT_NAMES, Canvas.FONT_SIZE)
+        self.text = TextCache(self.font, Canvas.FONT_COLOUR)
+        self._stats_panel = None
+        self.dirty_rects = dirty_rects
+        self.dirty_threshold = dirty_threshold
+        self._full_redraw = True
+        self._stats_rect = None
+        self.draw_workers = draw_workers
+        self.draw_executor = None
+        if draw_workers:
+            self.draw_executor = ThreadPoolExecutor(max_workers=draw_workers)
+        self.set_render_resolution(render_scale, render_size)
+
+    @property
+    def scaled(self):
+        return self.surface is not self.display
+
+    def set_render_resolution(self, scale=1.0, size=None):
+        '''
+        Changes the resolution the world is rendered at, see
+        render_scale and render_size. Objects keep their state and
+        are redrawn at the new scale on the next frame.
+        '''
+        self.render_scale = scale
+        self.render_size = size
+        if size is None:
+            size = (max(int(round(self.width * scale)), 1),
+                    max(int(round(self.height * scale)), 1))
+        if tuple(size) == (self.width, self.height):
+            self.surface = self.display
+        else:
+            self.surface = pygame.Surface(size)
+        self.camera.resize(*self.surface.get_size())
+        self._full_redraw = True
+        self._stats_rect = None
+        self.scale_background_image()
 
     def render(self, objects=[], stats=[]):
+        if self.dirty_rects:
+            return self.render_dirty(objects, stats)
         self.render_background()
+        self.pre_render_objects(objects)
         for obj in objects:
-            obj.pre_render(self.surface)
+            self.render_object(obj)
+        if self.scaled:
+            self.upscale()
+        if stats:
+            self.render_stats(stats)
+        self.present()
+
+    def pre_render_objects(self, objects):
+        if not instruments.enabled:
+            for obj in objects:
+                obj.pre_render(self.camera)
+        else:
+            for obj in objects:
+                with instruments.timer('pre_render %s' % type(obj).__name__):
+                    obj.pre_render(self.camera)
+        if self.draw_executor is not None:
+            with instruments.timer('prepare_draw'):
+                self.prepare_draw_objects(objects)
+
+    def prepare_draw_objects(self, objects):
+        '''
+        Runs prepare_draw of every dirty object that will be drawn
+        this frame on the worker threads and waits for all of them.
+        The surfaces are then drawn and blitted on this thread in
+        the usual order.
+        '''
+        display_rect = self.surface.get_rect()
+        jobs = [obj for obj in objects
+                if getattr(obj, 'PARALLEL_DRAW', False) and obj.dirty
+                and obj.is_shown and obj.display_rect.colliderect(display_rect)]
+        if len(jobs) < 2:
+            return
+        for _ in self.draw_executor.map(_prepare_draw, jobs):
+            pass
+
+    def render_object(self, obj):
+        if not instruments.enabled:
             obj.render(self.surface)
+            return
+        with instruments.timer('render %s' % type(obj).__name__):
+            obj.render(self.surface)
+
+    def render_dirty(self, objects=[], stats=[]):
+        '''
+        Restores the background and redraws the objects only in
+        the regions that changed, then presents just those regions.
+        Falls back to a full redraw when the changed area is larger
+        than dirty_threshold of the display. When the world is rendered
+        at a lower resolution only the rendering is limited to the
+        changed regions, the whole display is scaled up and presented.
+        '''
+        self.pre_render_objects(objects)
+
+        rects = []
+        for obj in objects:
+            rects.extend(obj.dirty_rects())
+        stats_surface = None
+        stats_rect = None
+        if stats and not self.scaled:
+            stats_surface = self.stats_surface(stats)
+            stats_rect = self.stats_rect(stats_surface)
+            rects.append(stats_rect)
+        if self._stats_rect:
+            rects.append(self._stats_rect)
+        self._stats_rect = stats_rect
+
+        display_rect = self.surface.get_rect()
+        rects = [rect.clip(display_rect) for rect in rects]
+        rects = [rect for rect in rects if rect.width and rect.height]
+        area = sum(rect.width * rect.height for rect in rects)
+
+        if (self._full_redraw or
+                area > self.dirty_threshold * display_rect.width * display_rect.height):
+            self._full_redraw = False
+            self.render_background()
+            for obj in objects:
+                self.render_object(obj)
+            if stats_surface:
+                self.surface.blit(stats_surface, stats_rect)
+            if self.scaled:
+                self.present_scaled(stats)
+            else:
+                self.present()
+            return
+
+        for rect in rects:
+            self.surface.set_clip(rect)
+            self.render_background(rect)
+            for obj in objects:
+                obj_rect = getattr(obj, 'display_rect', None)
+                if obj_rect is None or obj_rect.colliderect(rect):
+                    self.render_object(obj)
+            if stats_rect and stats_rect.colliderect(rect):
+                self.surface.blit(stats_surface, stats_rect)
+        self.surface.set_clip(None)
+        if self.scaled:
+            self.present_scaled(stats)
+        else:
+            self.present(rects)
+
+    def upscale(self):
+        '''
+        Scales the world up to the size of the display.
+        '''
+        size = self.display.get_size()
+        with instruments.timer('upscale'):
+            if self.smooth_scale:
+                pygame.transform.smoothscale(self.surface, size, self.display)
+            else:
+                pygame.transform.scale(self.surface, size, self.display)
+
+    def present_scaled(self, stats):
+        # stats are drawn on the display, at its resolution
+        self.upscale()
         if stats:
             self.render_stats(stats)
-        pygame.display.flip()
+        self.present()
+
+    def create_surface(self, width, height):
+        if self.offscreen:
+            return pygame.Surface((width, height))
+        return pygame.display.set_mode((width, height), Canvas.DISPLAY_FLAGS)
 
-    def render_background(self):
+    def present(self, rects=None):
+        '''
+        Shows the rendered frame, or just the given regions of it.
+        '''
+        if self.offscreen:
+            return
+        with instruments.timer('flip'):
+            if rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(rects)
+
+    def render_background(self, rect=None):
         if self.background_image:
-            self.surface.blit(self.background_image, (0, 0))
+            if rect:
+                self.surface.blit(self.background_image, rect, rect)
+            else:
+                self.surface.blit(self.background_image, (0, 0))
         else:
-            self.surface.fill(self.background)
+            self.surface.fill(self.background, rect)
 
     def render_stats(self, stats):
-        surfaces = []
+        stats_surface = self.stats_surface(stats)
+        self.display.blit(stats_surface, self.stats_rect(stats_surface))
+
+    def stats_rect(self, stats_surface):
+        # stats are drawn in the bottom right corner
+        return stats_surface.get_rect(
+            bottomright=(self.width - 4, self.height - 4))
+
+    def stats_surface(self, stats):
+        lines = []
         stats_height = 22
         stats_width = 100
         total_height = 0
         max_width = 0
         for label, value in stats:
             if type(value) is float:
-                surface = (self.font.render('%s: %.2f'
-                                            % (label, round(value, 2)),
-                                            True, Canvas.FONT_COLOUR))
+                value = '%.2f' % round(value, 2)
             else:
-                surface = (self.font.render('%s: %s'
-                                            % (label, value),
-                                            True, Canvas.FONT_COLOUR))
-            total_height += surface.get_height()
-            width = surface.get_width()
+                value = '%s' % value
+            label_surface = self.text.label('%s: ' % label)
+            glyphs = self.text.glyphs(value)
+            height = max([label_surface.get_height()] +
+                         [glyph.get_height() for glyph in glyphs])
+            width = (label_surface.get_width() +
+                     sum(glyph.get_width() for glyph in glyphs))
+            total_height += height
             if width > max_width:
                 max_width = width
-            surfaces.append(surface)
+            lines.append((label_surface, glyphs, height))
 
         # 4px padding, 2px in between lines
-        total_height += 8 + 2 * (len(surfaces) - 1)
+        total_height += 8 + 2 * (len(lines) - 1)
         if total_height > stats_height:
             stats_height = total_height
         if max_width + 8 > stats_width:
             stats_width = max_width + 8
 
-        stats_surface = pygame.Surface((stats_width, stats_height))
+        # the panel is only reallocated when its size changes
+        stats_surface = self._stats_panel
+        if (stats_surface is None or
+                stats_surface.get_size() != (stats_width, stats_height)):
+            if stats_surface is not None:
+                default_pool.release(stats_surface)
+            stats_surface = default_pool.acquire(stats_width, stats_height)
+            self._stats_panel = stats_surface
         stats_surface.fill(Canvas.STATS_BACKGROUND)
 
         x = 4
         y = stats_height - 2
-        for i in range(len(surfaces) - 1, -1, -1):
-            surface = surfaces[i]
-            y -= surface.get_height() + 2
-            stats_surface.blit(surface, (x, y))
+        for i in range(len(lines) - 1, -1, -1):
+            label_surface, glyphs, height = lines[i]
+            y -= height + 2
+            stats_surface.blit(label_surface, (x, y))
+            self.text.blit_glyphs(stats_surface, glyphs,
+                                  (x + label_surface.get_width(), y))
 
-        # draw stats surface in bottom right corner
-        self.surface.blit(stats_surface,
-                          (self.width - stats_width - 4,
-                           self.height - stats_height - 4))
+        return stats_surface
 
     def scale_background_image(self):
+        # plain colour backgrounds have no image to scale, resizing
+        # a canvas with one used to fail here
+        if type(self.background) in (tuple, list):
+            return
         self.background_image = pygame.transform.smoothscale(
             self.background,
-            (self.width, self.height)
+            self.surface.get_size()
         )
 
     def handle_resize(self, width, height):
         self.width = width
         self.height = height
-        self.surface = pygame.display.set_mode((width, height),
-                                               Canvas.DISPLAY_FLAGS)
-        self.scale_background_image()
+        self.display = self.create_surface(width, height)
+        self.set_render_resolution(self.render_scale, self.render_size)
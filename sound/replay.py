@@ -0,0 +1,258 @@
+'''
+Record and replay of game sessions. A log stores the options the
+world was created with (including its seed) followed by the elapsed
+time and the raw input events of every tick of the GameLoop, in a
+compact binary format:
+
+    header  b'SNDR', version (uint16), options length (uint32),
+            options (JSON)
+    tick    elapsed ms (float64), quality level (uint8),
+            number of events (uint16), events
+    event   type code (uint8) followed by its fields, see EVENT_FORMATS
+
+Replaying a log through a GameLoop simulates exactly the same steps,
+so logs double as deterministic profiling fixtures and as a way to
+check that optimised code paths render identical frames.
+
+    python -m sound.replay LOG [--realtime] [--checksums FILE] [--verify FILE]
+'''
+import sys
+import json
+import time
+import struct
+import hashlib
+import argparse
+
+import pygame
+
+
+MAGIC = b'SNDR'
+VERSION = 2
+
+HEADER = struct.Struct('<4sHI')
+TICK = struct.Struct('<dBH')
+EVENT_TYPE = struct.Struct('<B')
+
+# type code -> (pygame event type, field names, struct)
+EVENT_FORMATS = {
+    0: (pygame.QUIT, (), struct.Struct('<')),
+    1: (pygame.KEYDOWN, ('key', 'mod'), struct.Struct('<iH')),
+    2: (pygame.KEYUP, ('key', 'mod'), struct.Struct('<iH')),
+    3: (pygame.MOUSEBUTTONDOWN, ('button', 'pos'), struct.Struct('<Bhh')),
+    4: (pygame.MOUSEBUTTONUP, ('button', 'pos'), struct.Struct('<Bhh')),
+    5: (pygame.MOUSEMOTION, ('pos', 'rel'), struct.Struct('<hhhh')),
+    6: (pygame.VIDEORESIZE, ('w', 'h'), struct.Struct('<HH')),
+}
+EVENT_CODES = dict((event_type, code)
+                   for code, (event_type, _, _) in EVENT_FORMATS.items())
+
+
+def _flatten(values):
+    flat = []
+    for value in values:
+        if isinstance(value, (tuple, list)):
+            flat.extend(value)
+        else:
+            flat.append(value)
+    return flat
+
+
+class Recorder(object):
+    '''
+    Writes the options of a game and the input of every tick
+    to a log file.
+    '''
+
+    def __init__(self, path, options):
+        '''
+        options: dict, JSON serialisable options needed to recreate
+                 the game, see game_options
+        '''
+        self.file = open(path, 'wb')
+        data = json.dumps(options, sort_keys=True).encode('utf-8')
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(data)))
+        self.file.write(data)
+        self.ticks = 0
+
+    def record(self, elapsed, events, quality=0):
+        '''
+        quality: int, index of the quality level the tick ran at,
+                 the level changes the simulation (e.g. the pulse cap)
+        '''
+        encoded = []
+        for event in events:
+            code = EVENT_CODES.get(event.type)
+            if code is None:
+                continue
+            _, fields, fmt = EVENT_FORMATS[code]
+            values = _flatten(getattr(event, field) for field in fields)
+            encoded.append(EVENT_TYPE.pack(code) + fmt.pack(*values))
+        self.file.write(TICK.pack(elapsed, quality, len(encoded)))
+        self.file.write(b''.join(encoded))
+        self.ticks += 1
+
+    def close(self):
+        self.file.close()
+
+
+class Replay(object):
+    '''
+    Reads a log written by Recorder.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("'%s' is not a version %d replay log"
+                                 % (path, VERSION))
+            self.options = json.loads(f.read(length).decode('utf-8'))
+            self._offset = f.tell()
+
+    def ticks(self):
+        '''
+        Yields (elapsed, quality, events) for every recorded tick.
+        '''
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            while True:
+                data = f.read(TICK.size)
+                if len(data) < TICK.size:
+                    return
+                elapsed, quality, count = TICK.unpack(data)
+                events = []
+                for _ in range(count):
+                    code, = EVENT_TYPE.unpack(f.read(EVENT_TYPE.size))
+                    event_type, fields, fmt = EVENT_FORMATS[code]
+                    values = list(fmt.unpack(f.read(fmt.size)))
+                    attributes = {}
+                    for field in fields:
+                        if field in ('pos', 'rel'):
+                            attributes[field] = (values.pop(0), values.pop(0))
+                        else:
+                            attributes[field] = values.pop(0)
+                    events.append(pygame.event.Event(event_type, **attributes))
+                yield elapsed, quality, events
+
+
+def game_options(game, loop):
+    '''
+    Returns the options needed to recreate game and loop.
+    '''
+    canvas = game.canvas
+    return {
+        'seed': game.seed,
+        'hidden_objects': game.hidden_objects,
+        'incremental_echo': game.incremental_echo,
+        'debug': game.debug,
+        'world_path': game.world_path,
+        'width': canvas.width,
+        'height': canvas.height,
+        # the render path, so replays draw the frames the same way
+        'canvas': {
+            'dirty_rects': canvas.dirty_rects,
+            'dirty_threshold': canvas.dirty_threshold,
+            'draw_workers': canvas.draw_workers,
+            'render_scale': canvas.render_scale,
+            'render_size': canvas.render_size,
+            'smooth_scale': canvas.smooth_scale,
+        },
+        'step_time': loop.step_time,
+        'max_steps': loop.max_steps,
+        'max_frame_skip': loop.max_frame_skip,
+    }
+
+
+def replay(path, realtime=False, frame=None, show_stats=False,
+           canvas_options=None):
+    '''
+    Drives a new game headlessly with the recorded input and
+    quality levels. A frame is rendered for every tick that isn't
+    skipped, frame(surface) is called after each of them. The stats
+    overlay is left out unless show_stats is set, so frames don't
+    depend on timings. With realtime ticks are spaced out like they
+    were recorded, otherwise they run as fast as possible.
+    The canvas is set up like the recorded one, canvas_options
+    override its options. Returns the GameLoop.
+    '''
+    from sound.render import Canvas
+    from sound.game import Game
+    from sound.loop import GameLoop, timer
+    from sound.benchmark import init_headless
+
+    init_headless()
+    log = Replay(path)
+    options = log.options
+    recorded = dict(options.get('canvas', {}))
+    recorded.update(canvas_options or {})
+    canvas = Canvas(options['width'], options['height'], background=(0, 0, 0),
+                    **recorded)
+    game = Game(canvas, hidden_objects=options['hidden_objects'],
+                seed=options['seed'], debug=options['debug'],
+                incremental_echo=options['incremental_echo'],
+                world_path=options['world_path'])
+    loop = GameLoop(game, step_time=options['step_time'], render_rate=None,
+                    max_steps=options['max_steps'],
+                    max_frame_skip=options['max_frame_skip'],
+                    show_stats=show_stats)
+
+    start = timer()
+    played = 0.0
+    for elapsed, quality, events in log.ticks():
+        if quality != game.governor.index:
+            game.governor.set_level(quality)
+            game.set_quality(game.governor.level)
+        if realtime:
+            played += elapsed / 1000.0
+            wait = start + played - timer()
+            if wait > 0:
+                time.sleep(wait)
+        if loop.tick(elapsed, events) and frame is not None:
+            frame(canvas.display)
+        if not game.running:
+            break
+    return loop
+
+
+def frame_checksum(surface):
+    return hashlib.md5(pygame.image.tostring(surface, 'RGB')).hexdigest()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a recorded session')
+    parser.add_argument('log')
+    parser.add_argument('--realtime', action='store_true',
+                        help='play at the recorded speed')
+    parser.add_argument('--stats', action='store_true',
+                        help='draw the stats overlay')
+    parser.add_argument('--checksums', help='write a checksum per frame')
+    parser.add_argument('--verify', help='compare the frames with the '
+                        'checksums written by an earlier replay')
+    args = parser.parse_args(argv)
+
+    checksums = []
+    frame = None
+    if args.checksums or args.verify:
+        frame = lambda surface: checksums.append(frame_checksum(surface))
+    loop = replay(args.log, args.realtime, frame, args.stats)
+    sys.stdout.write('%d steps, %d frames\n' % (loop.steps, loop.frames))
+
+    if args.checksums:
+        with open(args.checksums, 'w') as f:
+            f.write('\n'.join(checksums) + '\n')
+    if args.verify:
+        with open(args.verify) as f:
+            expected = f.read().split()
+        if expected != checksums:
+            mismatches = [i for i, (a, b) in enumerate(zip(expected, checksums))
+                          if a != b]
+            sys.stdout.write('frames differ: %s\n' % (mismatches[:10] or
+                                                      'frame count'))
+            return 1
+        sys.stdout.write('all frames identical\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
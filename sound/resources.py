@@ -1,5 +1,8 @@
 import os
-import glob
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import pygame
 
@@ -8,39 +11,200 @@ ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
                           '../assets/')
 IMAGE_DIR = os.path.join(ASSETS_DIR, 'images')
 SOUND_DIR = os.path.join(ASSETS_DIR, 'sounds')
+MANIFEST_FILENAME = 'manifest.json'
 
 
 class InvalidResource(Exception):
     pass
 
 
-def load_image(filename):
-    filepath = get_resource_filepath(IMAGE_DIR, filename)
-    try:
-        return pygame.image.load(filepath)
-    except pygame.error:
-        raise InvalidResource("'%s' is not a valid image resource (full path: %s)"
-                              % (filename, filepath))
+class ResourceManager(object):
+    '''
+    Indexes the files in the assets directory once and keeps
+    decoded images and sounds in an LRU cache limited to
+    max_bytes. Named groups of assets can be preloaded in the
+    background on a thread pool.
+    '''
 
+    def __init__(self, assets_dir=ASSETS_DIR, manifest=None,
+                 max_bytes=64 * 1024 * 1024, workers=2):
+        '''
+        assets_dir: str, directory with the images and sounds directories
+        manifest: str, optional path of a manifest written by save_manifest,
+                  used instead of scanning assets_dir if it exists
+        max_bytes: int, budget of the decoded resource cache
+        workers: int, number of preloading threads
+        '''
+        self.assets_dir = assets_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.groups = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        if manifest and os.path.exists(manifest):
+            self.load_manifest(manifest)
+        else:
+            self.scan()
 
-def load_sound(filename):
-    filepath = get_resource_filepath(SOUND_DIR, filename)
-    try:
-        return pygame.mixer.Sound(filepath)
-    except pygame.error:
-        raise InvalidResource("'%s' is not a valid sound resource (full path: %s)"
-                              % (filename, filepath))
+    def scan(self):
+        '''
+        Indexes every file under assets_dir by its path relative
+        to assets_dir.
+        '''
+        files = []
+        for root, dirs, filenames in os.walk(self.assets_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                files.append(os.path.relpath(path, self.assets_dir))
+        self._build_index(files)
 
+    def load_manifest(self, path):
+        with open(path) as f:
+            manifest = json.load(f)
+        self._build_index(manifest['files'])
+        self.groups.update(manifest.get('groups', {}))
 
-def get_resource_filepath(base_dir, filename):
-    index = filename.rfind('.')
-    if index != -1:
-        return os.path.join(IMAGE_DIR, filename)
-    else:
-        filepaths = glob.glob('%s.*' % os.path.join(IMAGE_DIR, filename))
+    def save_manifest(self, path=None):
+        if path is None:
+            path = os.path.join(self.assets_dir, MANIFEST_FILENAME)
+        with open(path, 'w') as f:
+            json.dump({'files': sorted(self._files),
+                       'groups': self.groups}, f, indent=2, sort_keys=True)
+
+    def _build_index(self, files):
+        self._files = list(files)
+        # (directory, name) -> paths, names are looked up
+        # with and without their extension
+        self._index = {}
+        for relpath in self._files:
+            directory, filename = os.path.split(os.path.normpath(relpath))
+            path = os.path.join(self.assets_dir, relpath)
+            name = os.path.splitext(filename)[0]
+            self._index.setdefault((directory, filename), []).append(path)
+            if name != filename:
+                self._index.setdefault((directory, name), []).append(path)
+
+    def get_filepath(self, directory, filename):
+        '''
+        directory: str, directory relative to assets_dir (e.g. 'images')
+        filename: str, file name, the extension can be left out
+        '''
+        filepaths = self._index.get((directory, filename))
         if not filepaths:
-            raise InvalidResource("No resource matching '%s.*'"
-                                  % os.path.join(IMAGE_DIR, filename))
+            raise InvalidResource("No resource matching '%s'"
+                                  % os.path.join(directory, filename))
         elif len(filepaths) > 1:
-            raise InvalidResource("'%s' is ambiguous, it matches %s" % filepaths)
+            raise InvalidResource("'%s' is ambiguous, it matches %s"
+                                  % (filename, filepaths))
         return filepaths[0]
+
+    def load_image(self, filename):
+        return self._load('images', filename, pygame.image.load)
+
+    def load_sound(self, filename):
+        return self._load('sounds', filename, pygame.mixer.Sound)
+
+    def _load(self, directory, filename, loader):
+        filepath = self.get_filepath(directory, filename)
+        key = filepath
+        with self._lock:
+            entry = self._cache.pop(key, None)
+            if entry is not None:
+                self._cache[key] = entry
+                self.hits += 1
+                return entry[0]
+
+        try:
+            resource = loader(filepath)
+        except pygame.error:
+            raise InvalidResource("'%s' is not a valid %s resource (full path: %s)"
+                                  % (filename, directory[:-1], filepath))
+        size = resource_size(resource)
+
+        with self._lock:
+            self.misses += 1
+            if key not in self._cache:
+                self._cache[key] = (resource, size)
+                self.cached_bytes += size
+                self._evict()
+        return resource
+
+    def _evict(self):
+        # the most recently added resource is always kept
+        while self.cached_bytes > self.max_bytes and len(self._cache) > 1:
+            _, (resource, size) = self._cache.popitem(last=False)
+            self.cached_bytes -= size
+
+    def define_group(self, name, images=(), sounds=()):
+        self.groups[name] = {'images': list(images), 'sounds': list(sounds)}
+
+    def preload(self, name):
+        '''
+        Starts loading every asset of the named group in the
+        background and returns the list of futures.
+        '''
+        group = self.groups[name]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = []
+        for filename in group.get('images', ()):
+            futures.append(self._executor.submit(self.load_image, filename))
+        for filename in group.get('sounds', ()):
+            futures.append(self._executor.submit(self.load_sound, filename))
+        return futures
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.cached_bytes = 0
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def resource_size(resource):
+    '''
+    Approximate number of bytes used by a decoded image or sound.
+    '''
+    if isinstance(resource, pygame.Surface):
+        return resource.get_width() * resource.get_height() * resource.get_bytesize()
+    mixer = pygame.mixer.get_init()
+    if mixer:
+        frequency, size, channels = mixer
+        return int(resource.get_length() * frequency * channels * abs(size) // 8)
+    return 0
+
+
+_manager = None
+
+
+def get_manager():
+    '''
+    Returns the resource manager shared by load_image and
+    load_sound, creating it (and indexing the assets) on
+    first use.
+    '''
+    global _manager
+    if _manager is None:
+        _manager = ResourceManager(
+            manifest=os.path.join(ASSETS_DIR, MANIFEST_FILENAME))
+    return _manager
+
+
+def load_image(filename):
+    return get_manager().load_image(filename)
+
+
+def load_sound(filename):
+    return get_manager().load_sound(filename)
+
+
+def get_resource_filepath(base_dir, filename):
+    directory = os.path.relpath(base_dir, ASSETS_DIR)
+    return get_manager().get_filepath(directory, filename)
@@ -0,0 +1,131 @@
+'''
+Entity registry. Entities are registered once under the components
+they declare (see components_of) and stored per component in
+compact ordered lists, so the frame loop iterates each component
+directly instead of type-checking every object every frame.
+'''
+
+UPDATEABLE = 'updateable'
+COLLIDABLE = 'collidable'
+VISIBLE = 'visible'
+
+_type_components = {}
+
+
+def components_of(entity):
+    '''
+    Returns the components declared by the COMPONENTS attribute of
+    the entity's class and all of its base classes.
+    '''
+    cls = type(entity)
+    components = _type_components.get(cls)
+    if components is None:
+        components = []
+        for klass in reversed(cls.__mro__):
+            for component in klass.__dict__.get('COMPONENTS', ()):
+                if component not in components:
+                    components.append(component)
+        components = _type_components[cls] = tuple(components)
+    return components
+
+
+class ComponentList(object):
+    '''
+    List of entities with O(1) add, remove and membership tests.
+    Removing swaps the last entity into the hole, so the order is
+    deterministic but not insertion order once entities are removed.
+    '''
+
+    def __init__(self):
+        self._items = []
+        self._index = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, entity):
+        return entity in self._index
+
+    def add(self, entity):
+        if entity in self._index:
+            return
+        self._index[entity] = len(self._items)
+        self._items.append(entity)
+
+    def remove(self, entity):
+        index = self._index.pop(entity)
+        last = self._items.pop()
+        if last is not entity:
+            self._items[index] = last
+            self._index[last] = index
+
+    def clear(self):
+        del self._items[:]
+        self._index.clear()
+
+
+class World(object):
+    '''
+    Registry of every entity of the game by component. Removals
+    are deferred until flush, which is called at the end of a frame,
+    so components can be iterated safely while entities die.
+    '''
+
+    def __init__(self):
+        self.entities = ComponentList()
+        self.components = {}
+        self._removed = []
+
+    def get(self, component):
+        '''
+        Returns the ComponentList of the entities with component.
+        '''
+        entities = self.components.get(component)
+        if entities is None:
+            entities = self.components[component] = ComponentList()
+        return entities
+
+    def __iter__(self):
+        return iter(self.entities)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def __contains__(self, entity):
+        return entity in self.entities
+
+    def add(self, entity, components=None):
+        '''
+        Registers entity under components, by default the
+        components it declares.
+        '''
+        if components is None:
+            components = components_of(entity)
+        self.entities.add(entity)
+        for component in components:
+            self.get(component).add(entity)
+
+    def remove(self, entity):
+        '''
+        Schedules entity to be removed at the end of the frame.
+        '''
+        self._removed.append(entity)
+
+    def flush(self):
+        '''
+        Removes the entities scheduled for removal and returns them.
+        '''
+        removed = []
+        for entity in self._removed:
+            if entity not in self.entities:
+                continue
+            self.entities.remove(entity)
+            for entities in self.components.values():
+                if entity in entities:
+                    entities.remove(entity)
+            removed.append(entity)
+        del self._removed[:]
+        return removed